@@ -32,6 +32,7 @@ kubectl apply -f k8s/namespace.yaml
 echo -e "${GREEN}Namespace aplicado.${NC}"
 
 # --- Paso 4: Bucle para construir y desplegar cada servicio ---
+# La librería compartida (services/common) no es un servicio: no tiene Dockerfile ni k8s.
 for service_dir in services/*/; do
     # Extraer el nombre del servicio del nombre del directorio
     service_name=$(basename "$service_dir")
@@ -41,7 +42,8 @@ for service_dir in services/*/; do
     # Construir la imagen de Docker si existe un Dockerfile
     if [ -f "${service_dir}Dockerfile" ]; then
         echo "Construyendo la imagen de Docker para $service_name..."
-        docker build -t "$service_name:latest" "$service_dir"
+        # El contexto de build es services/ para poder copiar la librería compartida saga_kit
+        docker build -t "$service_name:latest" -f "${service_dir}Dockerfile" services/
         echo -e "${GREEN}Imagen '$service_name:latest' construida exitosamente.${NC}"
     else
         echo "No se encontró Dockerfile para $service_name. Saltando la construcción de la imagen."
@@ -0,0 +1,31 @@
+"""
+saga_kit: piezas comunes para los participantes de la SAGA.
+
+Todos los servicios comparten el mismo patrón (parsear el objeto SAGA, validar campos,
+idempotencia por orderId, health checks...). Este paquete lo implementa una sola vez.
+"""
+from .app import create_app, get_logger
+from .diagnostics import admin_router
+from .idempotency import IdempotencyStore
+from .metrics import ServiceMetrics
+from .models import RequestData, SagaBatch, SagaPayload, saga_batch, saga_payload
+from .persistence import Journal, JournalError, PersistentDict, open_journal
+from .responses import FastJSONResponse
+
+__all__ = [
+    "create_app",
+    "get_logger",
+    "admin_router",
+    "IdempotencyStore",
+    "Journal",
+    "JournalError",
+    "PersistentDict",
+    "open_journal",
+    "ServiceMetrics",
+    "RequestData",
+    "SagaPayload",
+    "SagaBatch",
+    "saga_payload",
+    "saga_batch",
+    "FastJSONResponse",
+]
@@ -0,0 +1,70 @@
+import logging
+import os
+from typing import Callable, Dict, Optional
+
+from fastapi import FastAPI
+
+from .diagnostics import DIAGNOSTICS_ENABLED, admin_router
+from .idempotency import IdempotencyStore
+from .metrics import ServiceMetrics, ServiceMiddleware
+from .persistence import journals_healthy
+from .responses import FastJSONResponse
+
+
+def get_logger(service_name: str) -> logging.Logger:
+    """Logger del servicio (nivel configurable con LOG_LEVEL)."""
+    logging.basicConfig(
+        level=os.getenv("LOG_LEVEL", "INFO"),
+        format="%(asctime)s %(levelname)s [%(name)s] %(message)s",
+    )
+    return logging.getLogger(service_name)
+
+
+def create_app(
+    service_name: str,
+    title: str,
+    description: str = "",
+    stores: Optional[Dict[str, IdempotencyStore]] = None,
+    ready_check: Optional[Callable[[], bool]] = None,
+) -> FastAPI:
+    """
+    Crea la aplicación FastAPI estándar de un participante de la SAGA:
+    - respuestas JSON con FastJSONResponse;
+    - middleware de deadline y métricas;
+    - endpoints /health, /ready y /metrics;
+    - endpoints de diagnóstico /admin si DIAGNOSTICS_ENABLED está activo y hay DIAGNOSTICS_TOKEN.
+
+    `stores` son las tablas de idempotencia cuyas estadísticas se publican en /metrics.
+    `ready_check` decide si el servicio puede recibir tráfico (por defecto siempre listo);
+    además, el servicio deja de estar listo si algún journal no puede escribir en disco.
+    """
+    app = FastAPI(title=title, description=description, default_response_class=FastJSONResponse)
+    metrics = ServiceMetrics()
+    app.state.metrics = metrics
+    app.state.logger = get_logger(service_name)
+    app.add_middleware(ServiceMiddleware, metrics=metrics, logger=app.state.logger)
+
+    for name, store in (stores or {}).items():
+        metrics.register_gauge(name, store.stats)
+
+    @app.get("/health")
+    async def health_check():
+        """Verifica el estado del servicio para Kubernetes (livenessProbe)."""
+        return {"service": service_name, "status": "healthy"}
+
+    @app.get("/ready")
+    async def readiness_check():
+        """Indica si el servicio puede recibir tráfico (readinessProbe)."""
+        if not journals_healthy() or (ready_check is not None and not ready_check()):
+            return FastJSONResponse({"service": service_name, "status": "not_ready"}, status_code=503)
+        return {"service": service_name, "status": "ready"}
+
+    @app.get("/metrics")
+    async def get_metrics():
+        """Métricas del servicio: peticiones por ruta, deadlines vencidos y tablas de idempotencia."""
+        return {"service": service_name, **metrics.snapshot()}
+
+    if DIAGNOSTICS_ENABLED:
+        app.include_router(admin_router())
+
+    return app
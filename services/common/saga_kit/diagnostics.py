@@ -0,0 +1,177 @@
+import asyncio
+import hmac
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+logger = logging.getLogger("saga_kit.diagnostics")
+
+# Las peticiones a /admin deben enviar la cabecera X-Admin-Token con este valor.
+DIAGNOSTICS_TOKEN = os.getenv("DIAGNOSTICS_TOKEN") or None
+# Los endpoints de diagnóstico solo existen si el deployment los activa y define un token:
+# desactivados no se registran rutas ni se arranca ningún hilo, así que no cuestan nada.
+DIAGNOSTICS_ENABLED = os.getenv("DIAGNOSTICS_ENABLED", "false").lower() == "true"
+if DIAGNOSTICS_ENABLED and DIAGNOSTICS_TOKEN is None:
+    logger.warning("DIAGNOSTICS_ENABLED está activo pero falta DIAGNOSTICS_TOKEN: no se registran los endpoints /admin.")
+    DIAGNOSTICS_ENABLED = False
+MAX_PROFILE_SECONDS = 60
+MAX_TASKS_REPORTED = 200
+
+
+class ProfilerBusy(Exception):
+    """Ya hay una sesión de profiling en curso."""
+
+
+class SamplingProfiler:
+    """
+    Profiler por muestreo: un hilo de fondo toma cada `interval` segundos la pila de todos
+    los hilos del proceso (sys._current_frames) y cuenta cuántas veces aparece cada pila.
+
+    El resultado está en formato "collapsed stacks" (una línea `hilo;f1;f2;...;fN cuenta`
+    por pila), que aceptan flamegraph.pl, speedscope o inferno. El hilo del event loop
+    (MainThread) muestra dónde se va la CPU de la aplicación; `select` en `_run_once` es
+    tiempo ocioso.
+    """
+
+    def __init__(self):
+        self.running = False
+        self._labels: Dict[Any, str] = {}
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            filename = "/".join(code.co_filename.split(os.sep)[-2:])
+            name = getattr(code, "co_qualname", code.co_name)
+            label = self._labels[code] = f"{name} ({filename}:{code.co_firstlineno})"
+        return label
+
+    def _sample_loop(self, interval: float, stop: threading.Event, counts: Counter) -> None:
+        own_ident = threading.get_ident()
+        while not stop.wait(interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                stack.reverse()
+                counts[";".join(stack)] += 1
+
+    async def profile(self, seconds: float, hz: int = 100) -> str:
+        """Muestrea durante `seconds` segundos a `hz` muestras por segundo y devuelve las pilas colapsadas."""
+        if self.running:
+            raise ProfilerBusy()
+        self.running = True
+        stop = threading.Event()
+        counts: Counter = Counter()
+        sampler = threading.Thread(
+            target=self._sample_loop, args=(1.0 / hz, stop, counts), name="sampling-profiler", daemon=True
+        )
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            stop.set()
+            sampler.join()
+            self.running = False
+            self._labels.clear()
+        return "\n".join(f"{stack} {count}" for stack, count in counts.most_common()) + "\n"
+
+
+async def event_loop_lag(samples: int = 5) -> Dict[str, float]:
+    """
+    Mide cuánto tarda el event loop en volver a ejecutar una tarea que cede el turno:
+    con el loop libre es casi cero; si hay trabajo bloqueando, crece.
+    """
+    lags: List[float] = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        await asyncio.sleep(0)
+        lags.append(time.perf_counter() - start)
+    return {
+        "avgMs": round(sum(lags) / len(lags) * 1000, 3),
+        "maxMs": round(max(lags) * 1000, 3),
+    }
+
+
+def innermost_frame(coro) -> Optional[Any]:
+    """
+    Frame en el que está suspendida una corrutina. `task.get_stack()` solo devuelve el de la
+    corrutina de la tarea (la más externa); aquí se sigue la cadena de `await` hasta la última
+    corrutina o generador, que es la línea que realmente espera.
+    """
+    frame = None
+    while coro is not None:
+        current = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None) or getattr(coro, "ag_frame", None)
+        if current is None:
+            break
+        frame = current
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None) or getattr(coro, "ag_await", None)
+    return frame
+
+
+def running_tasks(limit: int = MAX_TASKS_REPORTED) -> Dict[str, Any]:
+    """Tareas asyncio vivas con la corrutina y la línea más interna en la que están suspendidas."""
+    current = asyncio.current_task()
+    tasks = []
+    all_tasks = [task for task in asyncio.all_tasks() if task is not current]
+    for task in all_tasks[:limit]:
+        coro = task.get_coro()
+        frame = innermost_frame(coro)
+        location = f"{frame.f_code.co_filename}:{frame.f_lineno}" if frame is not None else None
+        tasks.append({
+            "name": task.get_name(),
+            "coroutine": getattr(coro, "__qualname__", repr(coro)),
+            "location": location,
+        })
+    return {"taskCount": len(all_tasks), "tasks": tasks}
+
+
+def require_admin_token(x_admin_token: Optional[str] = Header(None)) -> None:
+    # Comparación en tiempo constante para no filtrar el token por tiempos de respuesta.
+    if DIAGNOSTICS_TOKEN is None or x_admin_token is None or not hmac.compare_digest(
+        x_admin_token.encode(), DIAGNOSTICS_TOKEN.encode()
+    ):
+        raise HTTPException(status_code=403, detail="Token de administración inválido.")
+
+
+def admin_router() -> APIRouter:
+    """
+    Endpoints de diagnóstico bajo /admin:
+    - POST /admin/profile?seconds=N: profiling por muestreo durante N segundos (pilas colapsadas).
+    - GET /admin/loop: lag del event loop y tareas en ejecución.
+    El llamador solo debe incluirlo si DIAGNOSTICS_ENABLED está activo; sin DIAGNOSTICS_TOKEN
+    no se construye.
+    """
+    if DIAGNOSTICS_TOKEN is None:
+        raise RuntimeError("Los endpoints /admin requieren DIAGNOSTICS_TOKEN.")
+    router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin_token)])
+    profiler = SamplingProfiler()
+
+    @router.post("/profile", response_class=PlainTextResponse)
+    async def profile(
+        seconds: float = Query(10, gt=0, le=MAX_PROFILE_SECONDS),
+        hz: int = Query(100, gt=0, le=1000),
+    ):
+        """Ejecuta el profiler durante `seconds` segundos y devuelve un volcado compatible con flame graphs."""
+        try:
+            return await profiler.profile(seconds, hz)
+        except ProfilerBusy:
+            raise HTTPException(status_code=409, detail="Ya hay un profiling en curso.")
+
+    @router.get("/loop")
+    async def loop_status():
+        """Lag del event loop y tareas asyncio en ejecución."""
+        return {"lag": await event_loop_lag(), **running_tasks()}
+
+    return router
@@ -0,0 +1,154 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from .persistence import Journal
+
+# Límites opcionales, configurables desde el deployment. Por defecto no hay límite: las
+# tablas guardan estado de negocio (reservas, paquetes...) que una compensación posterior
+# necesita encontrar, así que descartar entradas solo es seguro si se activa a propósito.
+DEFAULT_MAX_ENTRIES = int(os.environ["IDEMPOTENCY_MAX_ENTRIES"]) if os.getenv("IDEMPOTENCY_MAX_ENTRIES") else None
+DEFAULT_TTL_SECONDS = float(os.environ["IDEMPOTENCY_TTL_SECONDS"]) if os.getenv("IDEMPOTENCY_TTL_SECONDS") else None
+
+
+class IdempotencyStore:
+    """
+    Tabla de idempotencia indexada por orderId, con límites opcionales.
+
+    - Con `max_entries`, al superarlo se descarta la entrada más antigua.
+    - Con `ttl_seconds`, cada entrada expira ese tiempo después de su última escritura.
+    Sin límites (el valor por defecto) nunca se descarta nada. La expiración es perezosa
+    (se revisa al acceder y al insertar), sin hilos extra.
+
+    Con un `journal` (ver `open_journal`) las escrituras y borrados se persisten y la
+    tabla se reconstruye al arrancar, conservando el instante de escritura de cada entrada.
+    Las modificaciones in-place de un valor deben volver a guardarse con `store[key] = value`.
+    """
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = DEFAULT_MAX_ENTRIES,
+        ttl_seconds: Optional[float] = DEFAULT_TTL_SECONDS,
+        journal: Optional[Journal] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # { key: (escrita_en (reloj monotónico), valor) } ordenado por antigüedad de escritura
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._journal = None
+        if journal is not None:
+            self._restore(journal)
+            journal.bind(self._snapshot_state)
+        self._journal = journal
+
+    # --- Persistencia ---
+
+    def _restore(self, journal: Journal) -> None:
+        snapshot, records = journal.load()
+        # instante de escritura: epoch -> reloj monotónico
+        offset = time.monotonic() - time.time()
+        entries = self._entries
+        for key, (value, written_at) in (snapshot or {}).items():
+            entries[key] = (written_at + offset, value)
+        for record in records:
+            if record[0] == "put":
+                entries[record[1]] = (record[3] + offset, record[2])
+                entries.move_to_end(record[1])
+            else:
+                entries.pop(record[1], None)
+        self._purge_expired(time.monotonic())
+        while self.max_entries is not None and len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def _snapshot_state(self) -> Dict[str, Any]:
+        # { key: [valor, instante de escritura (epoch)] }
+        offset = time.time() - time.monotonic()
+        return {key: [value, written_at + offset] for key, (written_at, value) in self._entries.items()}
+
+    def _expired(self, written_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - written_at >= self.ttl_seconds
+
+    def _purge_expired(self, now: float) -> None:
+        if self.ttl_seconds is None:
+            return
+        # Las entradas están ordenadas por escritura, así que basta con mirar el principio.
+        while self._entries:
+            key, (written_at, _) = next(iter(self._entries.items()))
+            if not self._expired(written_at, now):
+                break
+            del self._entries[key]
+            self.evictions += 1
+
+    def get(self, key: str, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        if self._expired(entry[0], time.monotonic()):
+            del self._entries[key]
+            self.evictions += 1
+            self.misses += 1
+            return default
+        self.hits += 1
+        return entry[1]
+
+    def _insert(self, key: str, value: Any, written_at: float) -> None:
+        self._entries[key] = (written_at, value)
+        self._entries.move_to_end(key)
+        self._purge_expired(written_at)
+        while self.max_entries is not None and len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def put(self, key: str, value: Any) -> None:
+        self._insert(key, value, time.monotonic())
+        if self._journal is not None:
+            self._journal.append(["put", key, value, time.time()])
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        entry = self._entries.pop(key, None)
+        if entry is not None and self._journal is not None:
+            self._journal.append(["del", key])
+        if entry is None or self._expired(entry[0], time.monotonic()):
+            return default
+        return entry[1]
+
+    def __contains__(self, key: str) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and not self._expired(entry[0], time.monotonic())
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self:
+            raise KeyError(key)
+        return self._entries[key][1]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.put(key, value)
+
+    def __len__(self) -> int:
+        self._purge_expired(time.monotonic())
+        return len(self._entries)
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        self._purge_expired(time.monotonic())
+        return ((key, value) for key, (_, value) in self._entries.items())
+
+    def values(self) -> Iterator[Any]:
+        return (value for _, value in self.items())
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Copia de las entradas vigentes (para endpoints de consulta)."""
+        return dict(self.items())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self),
+            "maxEntries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
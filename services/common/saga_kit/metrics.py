@@ -0,0 +1,108 @@
+import time
+from typing import Any, Callable, Dict
+
+from .persistence import journal_marks, wait_durable
+from .responses import FastJSONResponse
+
+# Cabeceras con las que el orquestador propaga el deadline de la SAGA.
+DEADLINE_HEADER = b"x-saga-deadline-ms"
+BUDGET_HEADER = b"x-saga-budget-ms"
+# Marca el 504 del middleware: la petición se descartó sin ejecutarse porque su deadline ya
+# había vencido. Permite distinguirlo de un 504 de un proxy (servicio sobrecargado).
+DEADLINE_EXPIRED_HEADER = "X-Saga-Deadline-Expired"
+
+
+class ServiceMetrics:
+    """Contadores por ruta (peticiones, errores, latencia) y gauges registrados por el servicio."""
+
+    def __init__(self):
+        # { "/reserve_space": {"count": 10, "errors": 1, "latencyMsTotal": 12.3, "latencyMsMax": 4.1} }
+        self.routes: Dict[str, Dict[str, float]] = {}
+        self.expired_requests = 0
+        self._gauges: Dict[str, Callable[[], Any]] = {}
+
+    def register_gauge(self, name: str, fn: Callable[[], Any]) -> None:
+        """Registra una función que se evalúa al consultar /metrics."""
+        self._gauges[name] = fn
+
+    def observe(self, route: str, status_code: int, elapsed_ms: float) -> None:
+        stats = self.routes.get(route)
+        if stats is None:
+            stats = self.routes[route] = {"count": 0, "errors": 0, "latencyMsTotal": 0.0, "latencyMsMax": 0.0}
+        stats["count"] += 1
+        if status_code >= 500:
+            stats["errors"] += 1
+        stats["latencyMsTotal"] += elapsed_ms
+        if elapsed_ms > stats["latencyMsMax"]:
+            stats["latencyMsMax"] = elapsed_ms
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "routes": self.routes,
+            "expiredRequests": self.expired_requests,
+            **{name: fn() for name, fn in self._gauges.items()},
+        }
+
+
+def deadline_expired(headers) -> bool:
+    """True si las cabeceras de la SAGA indican que el deadline ya venció."""
+    for name, value in headers:
+        if name == DEADLINE_HEADER:
+            if value.lstrip(b"-").isdigit() and int(value) <= time.time() * 1000:
+                return True
+        elif name == BUDGET_HEADER:
+            if value.lstrip(b"-").isdigit() and int(value) <= 0:
+                return True
+    return False
+
+
+class ServiceMiddleware:
+    """
+    Middleware ASGI puro (sin BaseHTTPMiddleware) que:
+    - descarta con 504 las peticiones cuyo deadline de SAGA ya venció;
+    - retiene cada respuesta hasta que los registros que la petición anexó a los journals
+      estén sincronizados en disco (group commit): lo que el servicio confirma sobrevive a
+      una caída. Si el journal falló, la petición termina en 500;
+    - registra conteo, errores y latencia por ruta.
+    """
+
+    def __init__(self, app, metrics: ServiceMetrics, logger):
+        self.app = app
+        self.metrics = metrics
+        self.logger = logger
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if deadline_expired(scope["headers"]):
+            self.metrics.expired_requests += 1
+            self.logger.info("Deadline de la SAGA vencido para %s. Petición descartada.", scope["path"])
+            response = FastJSONResponse(
+                {"detail": "Deadline de la SAGA vencido"},
+                status_code=504,
+                headers={DEADLINE_EXPIRED_HEADER: "true"},
+            )
+            await response(scope, receive, send)
+            return
+
+        status_code = 500
+        start = time.perf_counter()
+        marks = journal_marks()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = 500
+                await wait_durable(since=marks)
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # El router deja la ruta resuelta en el scope; así la cardinalidad queda acotada.
+            route = scope.get("route")
+            label = getattr(route, "path", None) or "unmatched"
+            self.metrics.observe(label, status_code, (time.perf_counter() - start) * 1000)
@@ -0,0 +1,68 @@
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException, Request
+from pydantic import BaseModel, Field, ValidationError
+
+
+class RequestData(BaseModel):
+    """Datos originales del pedido tal como los recibe el orquestador."""
+    user: Optional[str] = None
+    product: Optional[str] = None
+    quantity: Optional[int] = None
+    shippingAddress: Optional[str] = None
+    paymentDetails: Optional[str] = None
+    scheduledAt: Optional[str] = None
+
+
+class SagaPayload(BaseModel):
+    """
+    Objeto de estado SAGA que el orquestador envía a cada servicio.
+    Todos los campos son opcionales: cada endpoint declara los que necesita con `require`.
+    """
+    orderId: Optional[str] = None
+    status: Optional[str] = None
+    request_data: RequestData = Field(default_factory=RequestData)
+    generatedData: Dict[str, Any] = Field(default_factory=dict)
+    stepsCompleted: List[str] = Field(default_factory=list)
+    compensationsExecuted: List[str] = Field(default_factory=list)
+
+    def require(self, *fields: str) -> None:
+        """
+        Verifica que los campos indicados tengan valor. `orderId` se busca en la raíz,
+        el resto en `request_data`. Lanza HTTP 400 con los campos requeridos.
+        """
+        missing = [
+            name for name in fields
+            if not (getattr(self, name) if name == "orderId" else getattr(self.request_data, name, None))
+        ]
+        if missing:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Faltan campos requeridos en el objeto SAGA: {', '.join(fields)}"
+            )
+
+
+class SagaBatch(BaseModel):
+    """Lote de objetos SAGA para endpoints de compensación agrupada."""
+    sagas: List[SagaPayload] = Field(default_factory=list)
+
+
+async def _parse_body(request: Request, model):
+    body = await request.body()
+    try:
+        return model.model_validate_json(body or b"{}")
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail=f"Objeto SAGA inválido: {e.errors()[0]['msg']}")
+
+
+async def saga_payload(request: Request) -> SagaPayload:
+    """
+    Dependencia de FastAPI: valida el cuerpo directamente desde los bytes
+    (sin pasar por un dict intermedio) y devuelve un SagaPayload tipado.
+    """
+    return await _parse_body(request, SagaPayload)
+
+
+async def saga_batch(request: Request) -> SagaBatch:
+    """Dependencia de FastAPI para los endpoints por lotes: {"sagas": [...]}."""
+    return await _parse_body(request, SagaBatch)
@@ -0,0 +1,358 @@
+import asyncio
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("saga_kit.persistence")
+
+# orjson es opcional: si no está instalado se usa el módulo json estándar.
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+# La persistencia es opcional: solo se activa si el deployment define STATE_DIR.
+STATE_DIR = os.getenv("STATE_DIR")
+# Ventana de group commit: los registros acumulados en este intervalo comparten un fsync.
+FSYNC_INTERVAL_SECONDS = float(os.getenv("STATE_FSYNC_INTERVAL_MS", "5")) / 1000
+# Cantidad de registros en el log tras la cual se escribe un snapshot compacto.
+SNAPSHOT_EVERY = int(os.getenv("STATE_SNAPSHOT_EVERY", "10000"))
+
+
+def _dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+def _loads(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _settle(future: asyncio.Future, error: Optional[BaseException]) -> None:
+    if future.done():
+        return
+    if error is None:
+        future.set_result(None)
+    else:
+        future.set_exception(JournalError(f"El journal no pudo escribir en disco: {error}"))
+
+
+class JournalError(Exception):
+    """El journal dejó de poder escribir en disco; el estado ya no se persiste."""
+
+
+class Journal:
+    """
+    Persistencia embebida de un estado en memoria: log de solo-anexado + snapshots.
+
+    - `append` solo serializa el registro y lo deja en un buffer (microsegundos); un hilo
+      de fondo escribe el buffer y hace un único fsync por ventana (group commit).
+    - `append` devuelve el número de secuencia del registro y `await wait_durable(seq)`
+      espera a que ese registro esté sincronizado en disco. Las respuestas de los servicios
+      esperan así su fsync (ver `ServiceMiddleware`): lo que el servicio ya confirmó
+      sobrevive a una caída; solo se pierde lo que aún no se había respondido.
+    - Si una escritura falla, el error se registra en el log, las esperas fallan con
+      `JournalError`, `append` deja de aceptar registros y `healthy` pasa a False.
+    - Cada `snapshot_every` registros se escribe un snapshot del estado completo y se
+      descartan los logs anteriores, así el arranque solo reproduce la cola reciente.
+
+    Archivos en `directory`: `<name>.snapshot` y `<name>.<generación>.log`.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        name: str,
+        fsync_interval: float = FSYNC_INTERVAL_SECONDS,
+        snapshot_every: int = SNAPSHOT_EVERY,
+    ):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.name = name
+        self.fsync_interval = fsync_interval
+        self.snapshot_every = snapshot_every
+
+        self._state_fn: Optional[Callable[[], Any]] = None
+        self._since_snapshot = 0
+        self._cond = threading.Condition()
+        # Serializa las escrituras al archivo entre el hilo de fondo y flush()
+        self._io_lock = threading.Lock()
+        # Elementos pendientes: bytes de registros o ("snapshot", generación, bytes)
+        self._pending: List[Any] = []
+        self._closed = False
+        # Secuencia del último registro anexado y del último sincronizado en disco.
+        self._appended = 0
+        self._durable = 0
+        # Esperas de wait_durable: (secuencia, loop, future)
+        self._waiters: List[Tuple[int, asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self.error: Optional[BaseException] = None
+
+        snapshot_generation, self._snapshot = self._read_snapshot()
+        self._records: List[Any] = []
+        self.generation = snapshot_generation
+        for generation in self._log_generations():
+            if generation >= snapshot_generation:
+                self._records.extend(self._read_log(generation))
+                self.generation = max(self.generation, generation)
+        self._since_snapshot = len(self._records)
+
+        self._file = open(self._log_path(self.generation), "ab")
+        self._flusher = threading.Thread(target=self._flush_loop, name=f"journal-{name}", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+        _journals.append(self)
+
+    # --- Rutas y lectura ---
+
+    def _log_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f"{self.name}.{generation}.log")
+
+    def _snapshot_path(self) -> str:
+        return os.path.join(self.directory, f"{self.name}.snapshot")
+
+    def _log_generations(self) -> List[int]:
+        pattern = re.compile(rf"^{re.escape(self.name)}\.(\d+)\.log$")
+        matches = (pattern.match(filename) for filename in os.listdir(self.directory))
+        return sorted(int(m.group(1)) for m in matches if m)
+
+    def _read_snapshot(self) -> Tuple[int, Any]:
+        if not os.path.exists(self._snapshot_path()):
+            return 0, None
+        with open(self._snapshot_path(), "rb") as f:
+            snapshot = _loads(f.read())
+        return snapshot["generation"], snapshot["state"]
+
+    def _read_log(self, generation: int) -> List[Any]:
+        records = []
+        with open(self._log_path(generation), "rb") as f:
+            for line in f:
+                try:
+                    records.append(_loads(line))
+                except ValueError:
+                    break  # Última línea incompleta (caída a mitad de escritura)
+        return records
+
+    def load(self) -> Tuple[Any, List[Any]]:
+        """Devuelve (estado del último snapshot o None, registros posteriores) y libera la memoria."""
+        snapshot, records = self._snapshot, self._records
+        self._snapshot, self._records = None, []
+        return snapshot, records
+
+    def bind(self, state_fn: Callable[[], Any]) -> None:
+        """Registra la función que produce el estado completo para los snapshots."""
+        self._state_fn = state_fn
+
+    # --- Escritura ---
+
+    @property
+    def healthy(self) -> bool:
+        return self.error is None
+
+    def append(self, record: Any) -> int:
+        """Deja el registro en el buffer y devuelve su número de secuencia."""
+        data = _dumps(record) + b"\n"
+        with self._cond:
+            if self.error is not None:
+                raise JournalError(f"El journal '{self.name}' no puede escribir en disco: {self.error}")
+            # Solo el primer registro de la ventana despierta al hilo de escritura.
+            if not self._pending:
+                self._cond.notify()
+            self._pending.append(data)
+            self._appended += 1
+            seq = self._appended
+        self._since_snapshot += 1
+        if self._since_snapshot >= self.snapshot_every and self._state_fn is not None:
+            self.compact()
+        return seq
+
+    async def wait_durable(self, seq: Optional[int] = None) -> None:
+        """Espera a que el registro `seq` (por defecto, el último anexado) esté sincronizado en disco."""
+        seq = self._appended if seq is None else seq
+        if self._durable >= seq:
+            return
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._cond:
+            if self.error is not None:
+                _settle(future, self.error)
+            elif self._durable >= seq:
+                return
+            else:
+                self._waiters.append((seq, loop, future))
+        await future
+
+    def _release_waiters(self, error: Optional[BaseException] = None) -> None:
+        with self._cond:
+            ready = [w for w in self._waiters if error is not None or w[0] <= self._durable]
+            self._waiters = [w for w in self._waiters if w not in ready]
+        for _, loop, future in ready:
+            try:
+                loop.call_soon_threadsafe(_settle, future, error)
+            except RuntimeError:
+                pass  # El loop ya se cerró
+
+    def compact(self) -> None:
+        """
+        Programa un snapshot del estado actual. El estado se serializa en el hilo del llamador
+        para que sea consistente con el orden del log; la escritura se hace en segundo plano.
+        """
+        state = _dumps({"generation": self.generation + 1, "state": self._state_fn()})
+        with self._cond:
+            self.generation += 1
+            self._pending.append(("snapshot", self.generation, state))
+            self._cond.notify()
+        self._since_snapshot = 0
+
+    def _flush_loop(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                closed = self._closed
+            try:
+                self.flush()
+            except Exception as exc:
+                logger.exception("Journal '%s': falló la escritura en %s", self.name, self.directory)
+                with self._cond:
+                    self.error = exc
+                    self._pending = []  # Ya no se puede escribir: no acumular sin límite.
+                self._release_waiters(exc)
+                return
+            if closed:
+                self._file.close()
+                return
+            # Ventana de group commit: los registros que lleguen mientras tanto comparten el próximo fsync.
+            time.sleep(self.fsync_interval)
+
+    def _write(self, pending: List[Any]) -> None:
+        chunk: List[bytes] = []
+        for item in pending:
+            if isinstance(item, bytes):
+                chunk.append(item)
+                continue
+            _, generation, state = item
+            self._file.write(b"".join(chunk))
+            chunk = []
+            self._rotate(generation, state)
+        if chunk:
+            self._file.write(b"".join(chunk))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _rotate(self, generation: int, state: bytes) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = open(self._log_path(generation), "ab")
+
+        tmp_path = f"{self._snapshot_path()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(state)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._snapshot_path())
+
+        # El snapshot ya cubre las generaciones anteriores.
+        for old_generation in self._log_generations():
+            if old_generation < generation:
+                os.remove(self._log_path(old_generation))
+
+    def flush(self) -> None:
+        """Bloquea hasta que los registros pendientes estén escritos y sincronizados en disco."""
+        with self._io_lock:
+            with self._cond:
+                pending, self._pending = self._pending, []
+                upto = self._appended
+            if pending:
+                self._write(pending)
+            with self._cond:
+                self._durable = max(self._durable, upto)
+        self._release_waiters()
+
+    def close(self) -> None:
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._flusher.join()
+        if self in _journals:
+            _journals.remove(self)
+
+
+# Journals abiertos en el proceso (para esperar sus fsync y para el readiness).
+_journals: List[Journal] = []
+
+
+def journal_marks() -> Dict[Journal, int]:
+    """Secuencia actual de cada journal abierto, para `wait_durable(since=...)`."""
+    return {journal: journal._appended for journal in _journals}
+
+
+async def wait_durable(since: Optional[Dict[Journal, int]] = None) -> None:
+    """
+    Espera a que todo lo anexado hasta ahora esté en disco. Con `since` (de `journal_marks`)
+    solo espera a los journals que recibieron registros desde entonces: una petición que no
+    escribió no espera ni falla por un journal averiado.
+    """
+    for journal in list(_journals):
+        if since is None or journal._appended > since.get(journal, 0):
+            await journal.wait_durable()
+
+
+def journals_healthy() -> bool:
+    return all(journal.healthy for journal in _journals)
+
+
+def open_journal(name: str) -> Optional[Journal]:
+    """Abre el journal `name` en STATE_DIR, o devuelve None si la persistencia no está activada."""
+    if not STATE_DIR:
+        return None
+    return Journal(STATE_DIR, name)
+
+
+class PersistentDict(dict):
+    """
+    Diccionario cuyos cambios por asignación (`d[k] = v`), `del d[k]` y `pop` se registran
+    en un journal. Sin journal se comporta como un dict normal.
+    """
+
+    def __init__(self, journal: Optional[Journal], initial: Optional[Dict[str, Any]] = None):
+        super().__init__(initial or {})
+        self._journal = None
+        if journal is not None:
+            snapshot, records = journal.load()
+            if snapshot is not None:
+                super().clear()
+                super().update(snapshot)
+            for record in records:
+                if record[0] == "set":
+                    super().__setitem__(record[1], record[2])
+                else:
+                    super().pop(record[1], None)
+            journal.bind(lambda: dict(self))
+        self._journal = journal
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        super().__setitem__(key, value)
+        if self._journal is not None:
+            self._journal.append(["set", key, value])
+
+    def __delitem__(self, key: str) -> None:
+        super().__delitem__(key)
+        if self._journal is not None:
+            self._journal.append(["del", key])
+
+    def pop(self, key: str, *default: Any) -> Any:
+        existed = key in self
+        value = super().pop(key, *default)
+        if existed and self._journal is not None:
+            self._journal.append(["del", key])
+        return value
@@ -0,0 +1,19 @@
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+# orjson es opcional: si no está instalado se usa el módulo json estándar.
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+class FastJSONResponse(JSONResponse):
+    """Respuesta JSON serializada con orjson (o json compacto si no está disponible)."""
+
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
@@ -1,11 +1,7 @@
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import Depends
 import os
 
-app = FastAPI(
-    title="Customer Service",
-    description="Servicio para gestionar el historial de clientes como parte de la SAGA."
-)
+from saga_kit import FastJSONResponse, IdempotencyStore, SagaPayload, create_app, open_journal, saga_payload
 
 # --- Variables de Entorno ---
 SERVICE_NAME = os.getenv("SERVICE_NAME", "customer-service")
@@ -13,35 +9,38 @@ SERVICE_PORT = int(os.getenv("SERVICE_PORT", "5010"))
 
 # --- Almacenamiento en Memoria (Base de datos simulada) ---
 # { "orderId-123": {"user": "...", "product": "...", "orderStatus": "COMPLETED"} }
-customer_history_db = {}
+customer_history_db = IdempotencyStore(journal=open_journal("customer_history"))
+
+app = create_app(
+    SERVICE_NAME,
+    title="Customer Service",
+    description="Servicio para gestionar el historial de clientes como parte de la SAGA.",
+    stores={"customerHistory": customer_history_db},
+)
+logger = app.state.logger
 
 
 @app.post("/update_history")
-async def update_history(request: Request):
+async def update_history(saga: SagaPayload = Depends(saga_payload)):
     """
     Acción Principal: Actualiza el historial del cliente con el nuevo pedido.
     Es idempotente: si el historial para esta orden ya existe, devuelve el éxito.
     """
-    saga_data = await request.json()
-    order_id = saga_data.get("orderId")
-    request_data = saga_data.get("request_data", {})
-    
-    user = request_data.get("user")
-    product = request_data.get("product")
-
-    if not all([order_id, user, product]):
-        raise HTTPException(status_code=400, detail="Faltan campos requeridos en el objeto SAGA: orderId, user, product")
+    saga.require("orderId", "user", "product")
+    order_id = saga.orderId
+    user = saga.request_data.user
+    product = saga.request_data.product
 
     # --- Lógica de Idempotencia ---
     if order_id in customer_history_db:
-        print(f"Historial para Order ID '{order_id}' ya existe. Devolviendo éxito.")
+        logger.info("Historial para Order ID '%s' ya existe. Devolviendo éxito.", order_id)
         response_content = {
             "customer": {
                 "historyUpdated": True,
                 "orderStatus": "COMPLETED"
             }
         }
-        return JSONResponse(content=response_content, status_code=200)
+        return FastJSONResponse(content=response_content, status_code=200)
 
     # --- Lógica de Negocio ---
     # Simula la actualización del historial del cliente
@@ -50,7 +49,7 @@ async def update_history(request: Request):
         "product": product,
         "orderStatus": "COMPLETED"
     }
-    print(f"Historial actualizado para Order ID '{order_id}' - Usuario: '{user}', Producto: '{product}'.")
+    logger.info("Historial actualizado para Order ID '%s' - Usuario: '%s', Producto: '%s'.", order_id, user, product)
 
     # --- Construcción de la Respuesta según el Contrato SAGA ---
     response_content = {
@@ -59,25 +58,24 @@ async def update_history(request: Request):
             "orderStatus": "COMPLETED"
         }
     }
-    return JSONResponse(content=response_content, status_code=201) # 201 Created es más apropiado aquí
+    return FastJSONResponse(content=response_content, status_code=201) # 201 Created es más apropiado aquí
 
 
 @app.post("/update_history_cancellation")
-async def update_history_cancellation(request: Request):
+async def update_history_cancellation(saga: SagaPayload = Depends(saga_payload)):
     """
     Acción de Compensación: Actualiza el historial del pedido a "CANCELLED".
     """
-    saga_data = await request.json()
-    order_id = saga_data.get("orderId")
+    saga.require("orderId")
+    order_id = saga.orderId
 
-    if not order_id:
-        raise HTTPException(status_code=400, detail="Falta el campo 'orderId' en el objeto SAGA")
-
-    if order_id in customer_history_db:
+    history = customer_history_db.get(order_id)
+    if history is not None:
         # Actualiza el estado a CANCELLED en lugar de eliminar
-        customer_history_db[order_id]["orderStatus"] = "CANCELLED"
-        print(f"Historial para Order ID '{order_id}' actualizado a CANCELLED.")
-        
+        history["orderStatus"] = "CANCELLED"
+        customer_history_db[order_id] = history
+        logger.info("Historial para Order ID '%s' actualizado a CANCELLED.", order_id)
+
         # Respuesta de compensación exitosa
         response_content = {
             "customer": {
@@ -85,34 +83,28 @@ async def update_history_cancellation(request: Request):
                 "status": "COMPENSATED"
             }
         }
-        return JSONResponse(content=response_content, status_code=200)
+        return FastJSONResponse(content=response_content, status_code=200)
     else:
         # Si el historial no existe, la compensación se considera exitosa (ya no está).
-        print(f"No se encontró historial para Order ID '{order_id}'. La compensación no es necesaria.")
+        logger.info("No se encontró historial para Order ID '%s'. La compensación no es necesaria.", order_id)
         response_content = {
             "customer": {
                 "orderId": order_id,
                 "status": "NOT_FOUND_OR_ALREADY_COMPENSATED"
             }
         }
-        return JSONResponse(content=response_content, status_code=200)
+        return FastJSONResponse(content=response_content, status_code=200)
 
 
 @app.get("/history")
 async def list_history():
     """Endpoint de utilidad para ver el estado actual del historial de clientes."""
-    return JSONResponse({
-        "customer_history": customer_history_db,
+    return {
+        "customer_history": customer_history_db.to_dict(),
         "count": len(customer_history_db)
-    })
-
-
-@app.get("/health")
-async def health_check():
-    """Verifica el estado del servicio para Kubernetes."""
-    return JSONResponse({"service": SERVICE_NAME, "status": "healthy"})
+    }
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=SERVICE_PORT)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=SERVICE_PORT)
@@ -1,12 +1,8 @@
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import Depends, HTTPException
 import os
 import random
 
-app = FastAPI(
-    title="Inventory Service",
-    description="Servicio para gestionar inventario como parte de la SAGA."
-)
+from saga_kit import FastJSONResponse, IdempotencyStore, PersistentDict, SagaBatch, SagaPayload, create_app, open_journal, saga_batch, saga_payload
 
 # --- Variables de Entorno ---
 SERVICE_NAME = os.getenv("SERVICE_NAME", "inventory-service")
@@ -15,26 +11,50 @@ FAILURE_RATE = float(os.getenv("FAILURE_RATE", 0.3))  # 30% de fallos
 
 # --- Inventario simulado (en memoria) ---
 # { "product-123": stock }
-inventory_db = {"product-001": 50, "product-002": 20, "product-003": 10}
+inventory_db = PersistentDict(open_journal("inventory"), {"product-001": 50, "product-002": 20, "product-003": 10})
+
+# --- Descuentos aplicados por orden ---
+# { "orderId-123": {"product": "...", "quantity": 1, "status": "APPLIED" | "REVERTED"} }
+# La compensación solo devuelve stock de órdenes con un descuento APPLIED, así que los
+# reintentos (cola de compensaciones, lotes repetidos tras un timeout) no suman stock de más.
+# La tabla es local al pod: el deployment corre una sola réplica para que la compensación
+# llegue siempre al pod que hizo el descuento.
+stock_movements_db = IdempotencyStore(journal=open_journal("stock_movements"))
+
+app = create_app(
+    SERVICE_NAME,
+    title="Inventory Service",
+    description="Servicio para gestionar inventario como parte de la SAGA.",
+)
+app.state.metrics.register_gauge("products", lambda: len(inventory_db))
+app.state.metrics.register_gauge("stockMovements", stock_movements_db.stats)
+
 
 def should_fail():
     return random.random() < FAILURE_RATE
 
 @app.post("/update_stock")
-async def update_stock(request: Request):
+async def update_stock(saga: SagaPayload = Depends(saga_payload)):
     """
     Acción principal: reducir stock de un producto.
     Falla aleatoriamente según FAILURE_RATE para simular errores.
     """
-
-    saga_data = await request.json()
-
-    data = await request.json()
-    request_data = saga_data.get("request_data", {})
-    product = request_data.get("product")
-
-    if not product:
-        raise HTTPException(status_code=400, detail="Falta 'product' en la SAGA")
+    saga.require("orderId", "product")
+    order_id = saga.orderId
+    product = saga.request_data.product
+
+    # Idempotente por orderId: un reintento no vuelve a descontar
+    movement = stock_movements_db.get(order_id)
+    if movement is not None:
+        if movement["status"] != "APPLIED":
+            raise HTTPException(status_code=409, detail=f"El descuento de la orden {order_id} ya fue revertido")
+        return FastJSONResponse({
+            "inventory": {
+                "product": movement["product"],
+                "stockUpdated": True,
+                "currentStock": inventory_db.get(movement["product"])
+            }
+        }, status_code=200)
 
     if product not in inventory_db:
         raise HTTPException(status_code=404, detail=f"Producto {product} no encontrado")
@@ -44,8 +64,9 @@ async def update_stock(request: Request):
 
     previous_stock = inventory_db[product]
     inventory_db[product] -= 1
+    stock_movements_db[order_id] = {"product": product, "quantity": 1, "status": "APPLIED"}
 
-    return JSONResponse({
+    return FastJSONResponse({
         "inventory": {
             "product": product,
             "stockUpdated": True,
@@ -54,45 +75,75 @@ async def update_stock(request: Request):
         }
     }, status_code=200)
 
-@app.post("/revert_stock")
-async def revert_stock(request: Request):
+def take_applied_movement(order_id: str):
     """
-    Acción de compensación: restaurar stock de un producto.
+    Marca como revertido el descuento de la orden. Devuelve (estado, movimiento):
+    - ("REVERTED", movimiento) si había un descuento aplicado que ahora hay que devolver.
+    - ("ALREADY_COMPENSATED", None) si el descuento ya se había revertido.
+    - ("NOT_APPLIED", None) si la orden nunca descontó stock. Queda registrada como revertida
+      para que un /update_stock que llegue tarde (el orquestador compensa los pasos cuyo
+      resultado no conoce) no descuente después.
     """
-
-    saga_data = await request.json()
-    
-    request_data = saga_data.get("request_data", {})
-    product = request_data.get("product")
-
-    if not product:
-        raise HTTPException(status_code=400, detail="Falta 'product' en la SAGA")
-
+    movement = stock_movements_db.get(order_id)
+    if movement is None:
+        stock_movements_db[order_id] = {"product": None, "quantity": 0, "status": "REVERTED"}
+        return "NOT_APPLIED", None
+    if movement["status"] != "APPLIED":
+        return "ALREADY_COMPENSATED", None
+    movement["status"] = "REVERTED"
+    stock_movements_db[order_id] = movement
+    return "REVERTED", movement
+
+def restock(product: str, quantity: int = 1) -> dict:
+    """Devuelve `quantity` unidades del producto al inventario."""
     if product not in inventory_db:
-        inventory_db[product] = 1  # inicializa si no existía
+        inventory_db[product] = 0  # inicializa si no existía
 
     previous_stock = inventory_db[product]
-    inventory_db[product] += 1
+    inventory_db[product] += quantity
 
-    return JSONResponse({
-        "inventory": {
-            "product": product,
-            "reverted": True,
-            "previousStock": previous_stock,
-            "currentStock": inventory_db[product]
-        }
-    }, status_code=200)
+    return {
+        "product": product,
+        "reverted": True,
+        "previousStock": previous_stock,
+        "currentStock": inventory_db[product]
+    }
+
+@app.post("/revert_stock")
+async def revert_stock(saga: SagaPayload = Depends(saga_payload)):
+    """
+    Acción de compensación: restaurar el stock descontado por la orden.
+    Es idempotente: solo revierte una vez y solo órdenes que descontaron stock.
+    """
+    saga.require("orderId")
+    status, movement = take_applied_movement(saga.orderId)
+    if movement is None:
+        return FastJSONResponse({"inventory": {"orderId": saga.orderId, "status": status}}, status_code=200)
+    return FastJSONResponse({"inventory": restock(movement["product"], movement["quantity"])}, status_code=200)
+
+@app.post("/revert_stock/batch")
+async def revert_stock_batch(batch: SagaBatch = Depends(saga_batch)):
+    """
+    Compensación por lotes: agrupa las órdenes por producto y restaura el stock
+    de cada producto con una sola actualización. Igual que /revert_stock, ignora las
+    órdenes sin descuento pendiente de revertir.
+    """
+    for saga in batch.sagas:
+        saga.require("orderId")
+    per_product = {}
+    for saga in batch.sagas:
+        _, movement = take_applied_movement(saga.orderId)
+        if movement is not None:
+            per_product[movement["product"]] = per_product.get(movement["product"], 0) + movement["quantity"]
+
+    results = [restock(product, quantity) for product, quantity in per_product.items()]
+    return FastJSONResponse({"inventory": results}, status_code=200)
 
 @app.get("/inventory")
 async def get_inventory():
     """Endpoint de utilidad para ver el stock actual."""
-    return JSONResponse(inventory_db)
-
-@app.get("/health")
-async def health():
-    """Health check para Kubernetes."""
-    return JSONResponse({"service": SERVICE_NAME, "status": "healthy"})
+    return inventory_db
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=SERVICE_PORT)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=SERVICE_PORT)
@@ -1,70 +1,65 @@
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import Depends
 import os
 import datetime
 
-app = FastAPI(
-    title="Notification Service",
-    description="Servicio encargado de enviar confirmaciones y cancelaciones dentro de la SAGA de logística."
-)
+from saga_kit import FastJSONResponse, IdempotencyStore, SagaPayload, create_app, open_journal, saga_payload
 
 # ---- Variables de entorno ---
 SERVICE_NAME = os.getenv("SERVICE_NAME", "notification-service")
 SERVICE_PORT = int(os.getenv("SERVICE_PORT", "5008"))
 
 # ---- Base de datos simulada (en memoria) ---
-notifications_db = []
+# { "orderId-123:CONFIRMATION": {"orderId": "...", "type": "...", "user": "...", "timestamp": "..."} }
+notifications_db = IdempotencyStore(journal=open_journal("notifications"))
+
+app = create_app(
+    SERVICE_NAME,
+    title="Notification Service",
+    description="Servicio encargado de enviar confirmaciones y cancelaciones dentro de la SAGA de logística.",
+    stores={"notifications": notifications_db},
+)
+logger = app.state.logger
+
+
+def send_notification(saga: SagaPayload, notification_type: str) -> dict:
+    """
+    Registra la notificación del tipo indicado para la orden.
+    Es idempotente: un reintento de la misma orden y tipo devuelve la notificación ya enviada.
+    """
+    saga.require("orderId", "user")
+    key = f"{saga.orderId}:{notification_type}"
+
+    notification = notifications_db.get(key)
+    if notification is None:
+        notification = {
+            "orderId": saga.orderId,
+            "type": notification_type,
+            "user": saga.request_data.user,
+            "timestamp": datetime.datetime.now().isoformat()
+        }
+        notifications_db[key] = notification
+    return notification
 
 
 @app.post("/send_confirmation")
-async def send_confirmation(request: Request):
+async def send_confirmation(saga: SagaPayload = Depends(saga_payload)):
     """Envía una notificación de confirmación de pedido."""
-    saga_data = await request.json()
-    order_id = saga_data.get("orderId")
-    request_data = saga_data.get("request_data", {})
-    
-    user = request_data.get("user")
-
-    if not all([order_id, user]):
-        raise HTTPException(status_code=400, detail="Faltan campos requeridos: orderId y user")
-
-    notification = {
-        "orderId": order_id,
-        "type": "CONFIRMATION",
-        "user": user,
-        "timestamp": datetime.datetime.now().isoformat()
-    }
-    notifications_db.append(notification)
-    print(f"✅ Notificación de CONFIRMACIÓN enviada para Order ID '{order_id}'")
-
-    return JSONResponse(
+    notification = send_notification(saga, "CONFIRMATION")
+    logger.info("✅ Notificación de CONFIRMACIÓN enviada para Order ID '%s'", saga.orderId)
+
+    return FastJSONResponse(
         {"notification": notification, "status": "SENT"},
         status_code=201
     )
 
 
 @app.post("/send_cancellation")
-async def send_cancellation(request: Request):
+async def send_cancellation(saga: SagaPayload = Depends(saga_payload)):
     """Envía una notificación de cancelación (compensación)."""
-    saga_data = await request.json()
-    order_id = saga_data.get("orderId")
-    request_data = saga_data.get("request_data", {})
-    
-    user = request_data.get("user")
-
-    if not all([order_id, user]):
-        raise HTTPException(status_code=400, detail="Faltan campos requeridos: orderId y user")
-
-    notification = {
-        "orderId": order_id,
-        "type": "CANCELLATION",
-        "user": user,
-        "timestamp": datetime.datetime.now().isoformat()
-    }
-    notifications_db.append(notification)
-    print(f"⚠️ Notificación de CANCELACIÓN enviada para Order ID '{order_id}'")
-
-    return JSONResponse(
+    notification = send_notification(saga, "CANCELLATION")
+    logger.info("⚠️ Notificación de CANCELACIÓN enviada para Order ID '%s'", saga.orderId)
+
+    return FastJSONResponse(
         {"notification": notification, "status": "SENT"},
         status_code=200
     )
@@ -73,13 +68,8 @@ async def send_cancellation(request: Request):
 @app.get("/notifications")
 async def list_notifications():
     """Devuelve todas las notificaciones enviadas (para depuración o monitoreo)."""
-    return JSONResponse({"count": len(notifications_db), "notifications": notifications_db})
-
-
-@app.get("/health")
-async def health_check():
-    """Verifica la salud del servicio."""
-    return JSONResponse({"service": SERVICE_NAME, "status": "healthy"})
+    notifications = list(notifications_db.values())
+    return {"count": len(notifications), "notifications": notifications}
 
 
 if __name__ == "__main__":
@@ -0,0 +1,94 @@
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+from saga_kit.persistence import Journal, PersistentDict
+
+
+class CompensationRetryQueue:
+    """
+    Cola durable de compensaciones pendientes.
+
+    Cada entrada se identifica por "orderId:step". Con un `directory`, los cambios se
+    registran en un journal de solo-anexado (ver `saga_kit.persistence.Journal`): cada
+    cambio solo serializa un registro y el fsync se hace en un hilo de fondo, así que el
+    event loop no se bloquea aunque se encolen muchas compensaciones a la vez. Un reinicio
+    del orquestador reconstruye la cola desde el journal.
+    Los reintentos usan backoff exponencial con jitter y un tope de espera.
+    """
+
+    def __init__(self, directory: Optional[str], base_delay: float = 1.0, max_delay: float = 300.0):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        journal = Journal(directory, "compensation_queue") if directory else None
+        # { "orderId:step": {"orderId", "step", "payload", "after", "attempts", "nextAttemptAt", "lastError"} }
+        self.entries: Dict[str, Dict[str, Any]] = PersistentDict(journal)
+
+    def backoff(self, attempts: int) -> float:
+        delay = min(self.max_delay, self.base_delay * (2 ** max(attempts - 1, 0)))
+        return delay * random.uniform(0.5, 1.0)
+
+    def enqueue(self, order_id: str, step: str, payload: Dict[str, Any], after: List[str], error: str) -> None:
+        self.entries[f"{order_id}:{step}"] = {
+            "orderId": order_id,
+            "step": step,
+            "payload": payload,
+            "after": after,
+            "attempts": 1,
+            "nextAttemptAt": time.time() + self.backoff(1),
+            "lastError": error,
+        }
+
+    def reschedule(self, keys: List[str], error: str) -> None:
+        now = time.time()
+        for key in keys:
+            entry = self.entries[key]
+            entry["attempts"] += 1
+            entry["nextAttemptAt"] = now + self.backoff(entry["attempts"])
+            entry["lastError"] = error
+            self.entries[key] = entry  # Vuelve a registrar la entrada modificada
+
+    def remove(self, keys: List[str]) -> None:
+        for key in keys:
+            self.entries.pop(key, None)
+
+    def remove_dependents(self, order_id: str, step: str) -> List[str]:
+        """
+        Quita las entradas de la orden que esperan (directa o indirectamente) a `step`.
+        Se usa cuando la compensación de `step` falló de forma permanente: sus dependientes
+        no pueden ejecutarse. Devuelve los pasos quitados.
+        """
+        removed: List[str] = []
+        blocked = [step]
+        while blocked:
+            dep = blocked.pop()
+            for key, entry in list(self.entries.items()):
+                if entry["orderId"] == order_id and dep in entry["after"]:
+                    self.entries.pop(key, None)
+                    removed.append(entry["step"])
+                    blocked.append(entry["step"])
+        return removed
+
+    def pending_for(self, order_id: str) -> List[str]:
+        return [entry["step"] for entry in self.entries.values() if entry["orderId"] == order_id]
+
+    def due(self) -> Dict[str, List[str]]:
+        """
+        Devuelve las entradas listas para reintentar, agrupadas por paso (servicio).
+        Una entrada espera mientras sigan pendientes las compensaciones de las que depende.
+        """
+        now = time.time()
+        by_step: Dict[str, List[str]] = {}
+        for key, entry in self.entries.items():
+            if entry["nextAttemptAt"] > now:
+                continue
+            if any(f"{entry['orderId']}:{dep}" in self.entries for dep in entry["after"]):
+                continue
+            by_step.setdefault(entry["step"], []).append(key)
+        return by_step
+
+    def stats(self) -> Dict[str, Any]:
+        by_step: Dict[str, int] = {}
+        for entry in self.entries.values():
+            by_step[entry["step"]] = by_step.get(entry["step"], 0) + 1
+        return {"pending": len(self.entries), "pendingByStep": by_step}
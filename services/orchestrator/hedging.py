@@ -0,0 +1,220 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+import httpx
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    """Percentil por rango más cercano de una lista ya ordenada (q entre 0 y 100)."""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(q / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class LatencyWindow:
+    """Últimas `size` latencias observadas (en segundos)."""
+
+    def __init__(self, size: int = 1000):
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, latency: float) -> None:
+        self._samples.append(latency)
+
+    def percentile(self, q: float) -> Optional[float]:
+        return percentile(sorted(self._samples), q)
+
+
+class HedgeBudget:
+    """
+    Presupuesto global de hedges (token bucket compartido por todos los pasos).
+
+    Cada llamada original deposita `ratio` tokens y cada hedge consume uno, así los hedges
+    nunca superan `ratio` de la carga (p. ej. 0.05 = 5% de llamadas extra). `burst` limita
+    los tokens acumulados para que un período tranquilo no habilite una ráfaga de hedges.
+    """
+
+    def __init__(self, ratio: float = 0.05, burst: float = 10.0):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = 0.0
+        self.exhausted = 0
+
+    def deposit(self) -> None:
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        self.exhausted += 1
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {"ratio": self.ratio, "tokens": round(self.tokens, 2), "exhausted": self.exhausted}
+
+
+def is_definitive(response: httpx.Response) -> bool:
+    """Una respuesta definitiva (2xx o error de negocio 4xx) no se mejora con otro intento."""
+    return response.status_code < 500 and response.status_code != 429
+
+
+class StepHedger:
+    """
+    Hedging de las llamadas de un paso idempotente.
+
+    Si la llamada original no responde tras el percentil `percentile` de las latencias
+    recientes de los intentos originales del paso, se lanza una segunda copia y se usa la primera respuesta
+    definitiva. El intento perdedor no se cancela: sigue hasta terminar (lo acota su propio
+    timeout), que al ser idempotente es inocuo, y así su latencia real alimenta las
+    métricas y el limitador de concurrencia. No se hace hedge mientras haya menos de `min_samples`
+    latencias registradas, si el presupuesto global está agotado o si el llamador indica
+    que no hay capacidad (`can_hedge`).
+
+    Métricas: tasa de hedges, hedges ganadores y p99 de la latencia efectiva frente al
+    p99 del intento original (lo que se habría esperado sin hedging).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        budget: HedgeBudget,
+        percentile: float = 95.0,
+        min_samples: int = 20,
+        min_delay: float = 0.01,
+        window: int = 1000,
+        refresh_every: int = 20,
+    ):
+        self.name = name
+        self.budget = budget
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.refresh_every = refresh_every
+
+        self.latencies = LatencyWindow(window)          # latencia efectiva (primera respuesta usada)
+        self.primary_latencies = LatencyWindow(window)  # latencia del intento original
+        self._delay: Optional[float] = None
+        self._since_refresh = 0
+        # Intentos perdedores que siguen en curso (se guarda la referencia hasta que terminan).
+        self._stragglers: Set[asyncio.Future] = set()
+
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        """
+        Espera antes de lanzar el hedge, o None si aún no hay suficientes muestras.
+
+        Se calcula sobre la latencia de los intentos originales y no sobre la efectiva: los
+        hedges ganadores recortan la cola de la efectiva, y usarla haría que el umbral bajara
+        y se lanzaran hedges cada vez antes.
+        """
+        if self._delay is None or self._since_refresh >= self.refresh_every:
+            # Ordenar la ventana en cada llamada sería innecesario: el umbral se recalcula
+            # cada `refresh_every` muestras.
+            self._since_refresh = 0
+            if len(self.primary_latencies) >= self.min_samples:
+                self._delay = max(self.min_delay, self.primary_latencies.percentile(self.percentile))
+        return self._delay
+
+    def _record(self, latency: float) -> None:
+        self.latencies.record(latency)
+
+    async def call(
+        self,
+        attempt: Callable[[float], Awaitable[httpx.Response]],
+        timeout: float,
+        can_hedge: Callable[[], bool] = lambda: True,
+    ) -> httpx.Response:
+        """
+        Ejecuta `attempt(timeout)` con hedging. Devuelve la primera respuesta definitiva;
+        si ningún intento la obtiene, devuelve la última respuesta o relanza el último error.
+        """
+        started = time.monotonic()
+        self.requests += 1
+        self.budget.deposit()
+
+        primary = asyncio.ensure_future(attempt(timeout))
+        primary.add_done_callback(self._on_primary_done(started))
+        tasks = [primary]
+        pending = {primary}
+        try:
+            delay = self.hedge_delay()
+            if delay is not None and delay < timeout:
+                done, _ = await asyncio.wait(pending, timeout=delay)
+                if not done and can_hedge() and self.budget.withdraw():
+                    self.hedged += 1
+                    # Cada intento abre su propia conexión, así el Service de Kubernetes
+                    # puede enviarlo a otro pod.
+                    hedge = asyncio.ensure_future(attempt(timeout - (time.monotonic() - started)))
+                    tasks.append(hedge)
+                    pending.add(hedge)
+
+            last_response: Optional[httpx.Response] = None
+            last_error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # Si ambos terminan a la vez, se prefiere el intento original.
+                for task in sorted(done, key=tasks.index):
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                        continue
+                    response = task.result()
+                    if is_definitive(response):
+                        self._record(time.monotonic() - started)
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        return response
+                    last_response = response
+
+            if last_response is not None:
+                self._record(time.monotonic() - started)
+                return last_response
+            raise last_error
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            raise
+        finally:
+            for task in tasks:
+                if not task.done():
+                    self._stragglers.add(task)
+                    task.add_done_callback(self._on_straggler_done)
+
+    def _on_straggler_done(self, task: asyncio.Future) -> None:
+        self._stragglers.discard(task)
+        if not task.cancelled():
+            task.exception()  # El resultado del perdedor se descarta.
+
+    def _on_primary_done(self, started: float) -> Callable[[asyncio.Future], None]:
+        def record(task: asyncio.Future) -> None:
+            if task.cancelled():
+                return
+            error = task.exception()
+            # Un timeout también es la latencia que se habría esperado sin hedging.
+            if error is None or isinstance(error, httpx.TimeoutException):
+                self.primary_latencies.record(time.monotonic() - started)
+                self._since_refresh += 1
+        return record
+
+    def stats(self) -> Dict[str, Any]:
+        p99 = self.latencies.percentile(99)
+        p99_primary = self.primary_latencies.percentile(99)
+        delay = self._delay
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedgeRate": round(self.hedged / self.requests, 4) if self.requests else 0.0,
+            "hedgeWins": self.hedge_wins,
+            "hedgeDelayMs": round(delay * 1000, 2) if delay is not None else None,
+            "p99Ms": round(p99 * 1000, 2) if p99 is not None else None,
+            "p99PrimaryMs": round(p99_primary * 1000, 2) if p99_primary is not None else None,
+            "p99ImprovementMs": round((p99_primary - p99) * 1000, 2) if p99 is not None and p99_primary is not None else None,
+        }
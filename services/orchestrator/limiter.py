@@ -0,0 +1,162 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, Optional
+
+
+class QueueTimeout(asyncio.TimeoutError):
+    """No se obtuvo un turno para llamar al servicio dentro del tiempo disponible."""
+
+
+class CallSlot:
+    """Turno concedido por el limitador. El llamador lo marca si la respuesta indica un error."""
+
+    def __init__(self):
+        self.overloaded = False
+        self.failed = False
+
+    def mark_overloaded(self):
+        """El servicio indicó sobrecarga (429, 502, 503, 504): se reduce el límite de inmediato."""
+        self.overloaded = True
+
+    def mark_failed(self):
+        """Error de negocio o 5xx genérico: solo cuenta para la tasa de errores."""
+        self.failed = True
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Limitador de concurrencia AIMD por servicio.
+
+    - Incremento aditivo: cada llamada exitosa con latencia normal suma 1/limit al límite
+      (≈ +1 por cada "ventana" completa de llamadas).
+    - Decremento multiplicativo: timeouts, errores de conexión, respuestas de sobrecarga,
+      latencias mayores a `latency_tolerance` veces la latencia base (más `latency_slack`
+      segundos para no reaccionar al ruido de latencias muy bajas) o una tasa de errores
+      por encima de `error_threshold` multiplican el límite por `backoff_ratio`.
+    - La latencia base es la mínima observada, que se renueva cada `min_rtt_window` muestras
+      para adaptarse a cambios en el servicio.
+    - Las llamadas que esperan turno se atienden en orden de llegada (FIFO).
+
+    Con `static_limit` el límite queda fijo y no se adapta.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial_limit: int = 10,
+        min_limit: int = 1,
+        max_limit: int = 200,
+        backoff_ratio: float = 0.9,
+        latency_tolerance: float = 2.0,
+        latency_slack: float = 0.01,
+        error_threshold: float = 0.5,
+        min_rtt_window: int = 500,
+        static_limit: Optional[int] = None,
+    ):
+        self.name = name
+        self.static = static_limit is not None
+        self.limit = float(static_limit if self.static else initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_ratio = backoff_ratio
+        self.latency_tolerance = latency_tolerance
+        self.latency_slack = latency_slack
+        self.error_threshold = error_threshold
+        self.min_rtt_window = min_rtt_window
+
+        self.inflight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._min_rtt: Optional[float] = None
+        self._samples = 0
+        self._error_rate = 0.0  # media móvil exponencial de errores
+        self.decreases = 0
+
+    # --- Turnos ---
+
+    def _has_capacity(self) -> bool:
+        return self.inflight < int(self.limit)
+
+    def has_free_slot(self) -> bool:
+        """Indica si una llamada obtendría turno ahora mismo, sin hacer cola."""
+        return not self._waiters and self._has_capacity()
+
+    def _wake_waiters(self) -> None:
+        while self._waiters and self._has_capacity():
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.inflight += 1
+                waiter.set_result(None)
+
+    async def _acquire(self, timeout: Optional[float]) -> None:
+        if self.has_free_slot():
+            self.inflight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+            if waiter.done() and not waiter.cancelled():
+                # El turno llegó justo al vencer la espera: se devuelve.
+                self._release_slot()
+            else:
+                waiter.cancel()
+                self._waiters.remove(waiter)
+            if isinstance(exc, asyncio.TimeoutError):
+                raise QueueTimeout(f"Timed out waiting for a {self.name} concurrency slot")
+            raise
+
+    def _release_slot(self) -> None:
+        self.inflight -= 1
+        self._wake_waiters()
+
+    @asynccontextmanager
+    async def slot(self, timeout: Optional[float] = None):
+        """Espera un turno (como máximo `timeout` segundos) y registra el resultado de la llamada."""
+        await self._acquire(timeout)
+        slot = CallSlot()
+        start = time.perf_counter()
+        try:
+            yield slot
+        except Exception:
+            # Timeouts y errores de conexión son la señal de sobrecarga más clara.
+            slot.overloaded = True
+            raise
+        finally:
+            self._on_sample(time.perf_counter() - start, slot)
+            self._release_slot()
+
+    # --- Algoritmo AIMD ---
+
+    def _on_sample(self, rtt: float, slot: CallSlot) -> None:
+        self._samples += 1
+        if self._min_rtt is None or rtt < self._min_rtt or self._samples % self.min_rtt_window == 0:
+            self._min_rtt = rtt
+        self._error_rate = 0.9 * self._error_rate + 0.1 * (1.0 if (slot.failed or slot.overloaded) else 0.0)
+
+        if self.static:
+            return
+
+        congested = (
+            slot.overloaded
+            or rtt > self._min_rtt * self.latency_tolerance + self.latency_slack
+            or self._error_rate > self.error_threshold
+        )
+        if congested:
+            self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+            self.decreases += 1
+        else:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": int(self.limit),
+            "static": self.static,
+            "inflight": self.inflight,
+            "queued": len(self._waiters),
+            "minRttMs": round(self._min_rtt * 1000, 2) if self._min_rtt is not None else None,
+            "errorRate": round(self._error_rate, 3),
+            "decreases": self.decreases,
+        }
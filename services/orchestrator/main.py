@@ -1,5 +1,8 @@
+import asyncio
 import os
+import time
 import uuid
+from contextlib import asynccontextmanager
 from typing import List, Dict, Any, Optional
 
 import httpx
@@ -7,10 +10,24 @@ from fastapi import FastAPI, Request, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 
+from compensation import CompensationRetryQueue
+from hedging import HedgeBudget, StepHedger
+from saga_kit.diagnostics import DIAGNOSTICS_ENABLED, admin_router
+from slow_sagas import SagaTrace, SlowSagaLog
+from limiter import AdaptiveConcurrencyLimiter, QueueTimeout
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # El worker de reintentos de compensaciones vive mientras viva la aplicación.
+    retry_worker = asyncio.create_task(compensation_retry_worker())
+    yield
+    retry_worker.cancel()
+
 # --- Configuración de la Aplicación ---
 app = FastAPI(
     title="SAGA Orchestrator",
-    description="Orquesta el flujo de microservicios para procesar pedidos de logística."
+    description="Orquesta el flujo de microservicios para procesar pedidos de logística.",
+    lifespan=lifespan,
 )
 
 origins = [
@@ -40,17 +57,114 @@ URLS = {
     "customer": os.getenv("CUSTOMER_URL", "http://localhost:5010"),
 }
 
+# --- Límites de Concurrencia por Servicio ---
+# Cada servicio de URLS tiene un limitador AIMD que se ajusta según la latencia y los errores
+# observados. CONCURRENCY_LIMIT_<SERVICIO> (p. ej. CONCURRENCY_LIMIT_INVENTORY=8) fija un
+# límite estático para ese servicio.
+CONCURRENCY_INITIAL_LIMIT = int(os.getenv("CONCURRENCY_INITIAL_LIMIT", "10"))
+CONCURRENCY_MIN_LIMIT = int(os.getenv("CONCURRENCY_MIN_LIMIT", "1"))
+CONCURRENCY_MAX_LIMIT = int(os.getenv("CONCURRENCY_MAX_LIMIT", "200"))
+# Respuestas que indican sobrecarga del servicio (reducen el límite de inmediato). Un 504
+# con DEADLINE_EXPIRED_HEADER no cuenta: el servicio solo rechazó un deadline ya vencido.
+OVERLOAD_STATUS_CODES = {429, 502, 503, 504}
+
+def build_limiter(service_name: str) -> AdaptiveConcurrencyLimiter:
+    static_limit = os.getenv(f"CONCURRENCY_LIMIT_{service_name.upper()}")
+    return AdaptiveConcurrencyLimiter(
+        service_name,
+        initial_limit=CONCURRENCY_INITIAL_LIMIT,
+        min_limit=CONCURRENCY_MIN_LIMIT,
+        max_limit=CONCURRENCY_MAX_LIMIT,
+        static_limit=int(static_limit) if static_limit else None,
+    )
+
+limiters = {service_name: build_limiter(service_name) for service_name in URLS}
+
+# --- Hedging de Pasos Idempotentes ---
+# Si un paso declarado "idempotent" no responde tras el percentil HEDGE_PERCENTILE de sus
+# latencias recientes, se envía una segunda copia y se usa la primera respuesta.
+# HEDGE_BUDGET_RATIO limita los hedges a esa fracción de las llamadas (0.05 = 5% de carga extra).
+HEDGING_ENABLED = os.getenv("HEDGING_ENABLED", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_BUDGET_RATIO = float(os.getenv("HEDGE_BUDGET_RATIO", "0.05"))
+# Muestras mínimas antes de hacer hedge y espera mínima (evita hedges ante latencias de ruido).
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MIN_DELAY_MS = float(os.getenv("HEDGE_MIN_DELAY_MS", "10"))
+
+# --- Presupuesto de Tiempo (Deadline) de la SAGA ---
+# Cada SAGA dispone de un presupuesto total que se reparte entre los pasos pendientes.
+# El tiempo que un paso no consume queda disponible para los siguientes.
+SAGA_DEADLINE_SECONDS = float(os.getenv("SAGA_DEADLINE_SECONDS", "20"))
+# Tope por paso, aunque el presupuesto restante sea mayor.
+STEP_TIMEOUT_SECONDS = float(os.getenv("STEP_TIMEOUT_SECONDS", "10"))
+# Las compensaciones y los servicios finales SIEMPRE deben ejecutarse,
+# por eso tienen su propio timeout y no dependen del presupuesto de la SAGA.
+COMPENSATION_TIMEOUT_SECONDS = float(os.getenv("COMPENSATION_TIMEOUT_SECONDS", "10"))
+FINAL_STEP_TIMEOUT_SECONDS = float(os.getenv("FINAL_STEP_TIMEOUT_SECONDS", "5"))
+
+# Cabeceras con las que se propaga el presupuesto a los servicios:
+# - DEADLINE_HEADER: instante límite absoluto (epoch en milisegundos).
+# - BUDGET_HEADER: presupuesto restante en milisegundos al momento del envío.
+DEADLINE_HEADER = "X-Saga-Deadline-Ms"
+BUDGET_HEADER = "X-Saga-Budget-Ms"
+# El servicio responde 504 con esta cabecera cuando descarta una petición con el deadline vencido.
+DEADLINE_EXPIRED_HEADER = "X-Saga-Deadline-Expired"
+
 # --- Definición de los Pasos de la SAGA ---
 # Aquí se define el orden, la acción y la compensación de cada paso.
+# - compensateAfter: pasos cuya compensación debe terminar antes de compensar este.
+#   Las compensaciones sin restricciones entre sí se ejecutan en paralelo.
+# - batchCompensation: endpoint que acepta {"sagas": [...]} para compensar varias órdenes en una llamada.
+# - idempotent: la acción es idempotente por orderId aunque la repetición llegue a otro pod,
+#   así que admite hedging. Hoy ningún paso la lleva: la tabla de idempotencia de cada pod es
+#   local, así que un hedge que llegue a otra réplica duplicaría la acción, y con una sola
+#   réplica no hay otro pod al que enviarlo.
 SAGA_STEPS = [
-    {"name": "warehouse", "action": "/reserve_space", "compensation": "/cancel_reservation"},
-    {"name": "inventory", "action": "/update_stock", "compensation": "/revert_stock"},
-    {"name": "package", "action": "/create_package", "compensation": "/cancel_package"},
+    {"name": "warehouse", "action": "/reserve_space", "compensation": "/cancel_reservation", "batchCompensation": "/cancel_reservation/batch"},
+    {"name": "inventory", "action": "/update_stock", "compensation": "/revert_stock", "batchCompensation": "/revert_stock/batch"},
+    {"name": "package", "action": "/create_package", "compensation": "/cancel_package", "batchCompensation": "/cancel_package/batch", "compensateAfter": ["carrier"]},
     #{"name": "label", "action": "/generate_label", "compensation": "/void_label"},
-    {"name": "carrier", "action": "/assign_carrier", "compensation": "/cancel_assignment"},
+    {"name": "carrier", "action": "/assign_carrier", "compensation": "/cancel_assignment", "batchCompensation": "/cancel_assignment/batch"},
     #{"name": "pickup", "action": "/schedule_pickup", "compensation": "/cancel_pickup"},
     #{"name": "payment", "action": "/process_payment", "compensation": "/refund_payment"},
 ]
+SAGA_STEPS_BY_NAME = {step["name"]: step for step in SAGA_STEPS}
+
+# Servicios finales: se llaman siempre, tanto si la SAGA termina bien como si se compensa.
+FINAL_STEPS = [
+    {"name": "notification", "action": "/send_confirmation"},
+    {"name": "tracking", "action": "/update_status"},
+    {"name": "customer", "action": "/update_history"},
+]
+
+hedge_budget = HedgeBudget(ratio=HEDGE_BUDGET_RATIO)
+hedgers = {
+    step["name"]: StepHedger(
+        step["name"],
+        hedge_budget,
+        percentile=HEDGE_PERCENTILE,
+        min_samples=HEDGE_MIN_SAMPLES,
+        min_delay=HEDGE_MIN_DELAY_MS / 1000,
+    )
+    for step in SAGA_STEPS + FINAL_STEPS
+    if HEDGING_ENABLED and step.get("idempotent")
+}
+
+# --- Reintentos de Compensaciones ---
+# Las compensaciones fallidas se guardan en una cola durable y se reintentan con backoff
+# exponencial hasta completarse. Montar COMPENSATION_QUEUE_DIR en un volumen para
+# conservar la cola entre reinicios del contenedor.
+COMPENSATION_QUEUE_DIR = os.getenv("COMPENSATION_QUEUE_DIR", "compensation_queue")
+COMPENSATION_RETRY_INTERVAL_SECONDS = float(os.getenv("COMPENSATION_RETRY_INTERVAL_SECONDS", "1"))
+COMPENSATION_RETRY_MAX_DELAY_SECONDS = float(os.getenv("COMPENSATION_RETRY_MAX_DELAY_SECONDS", "300"))
+# Tamaño máximo de un lote cuando se agrupan compensaciones de un mismo servicio.
+COMPENSATION_BATCH_SIZE = int(os.getenv("COMPENSATION_BATCH_SIZE", "50"))
+
+# --- Diagnóstico ---
+# Con DIAGNOSTICS_ENABLED=true y DIAGNOSTICS_TOKEN definido se exponen los endpoints /admin
+# (profiling, event loop y SAGAs más lentas). Desactivado no se registra ninguna ruta ni se
+# toman tiempos por paso.
+SLOW_SAGA_CAPACITY = int(os.getenv("SLOW_SAGA_CAPACITY", "50"))
 
 # --- Modelos de Datos (Pydantic) ---
 class OrderRequest(BaseModel):
@@ -78,39 +192,134 @@ class SagaState(BaseModel):
     request_data: OrderRequest
     generatedData: GeneratedData = Field(default_factory=GeneratedData)
     stepsCompleted: List[str] = []
+    # Pasos cuyo resultado se desconoce (timeout, 504 o conexión cortada tras enviar la
+    # petición): pudieron ejecutarse en el servicio, así que también se compensan.
+    stepsInDoubt: List[str] = []
     compensationsExecuted: List[str] = []
 
 # --- "Base de Datos" en Memoria ---
 sagas_db: Dict[str, SagaState] = {}
 
+compensation_queue = CompensationRetryQueue(
+    COMPENSATION_QUEUE_DIR,
+    max_delay=COMPENSATION_RETRY_MAX_DELAY_SECONDS,
+)
+
+slow_sagas = SlowSagaLog(SLOW_SAGA_CAPACITY) if DIAGNOSTICS_ENABLED else None
+
+# --- Métricas ---
+# { "inventory": 3 } -> número de veces que un paso agotó su presupuesto.
+budget_overruns: Dict[str, int] = {step["name"]: 0 for step in SAGA_STEPS}
+
+class SagaDeadlineExceeded(Exception):
+    """
+    Se lanza cuando un paso no puede completarse dentro del presupuesto de la SAGA.
+    `in_doubt` indica que la petición pudo llegar a ejecutarse en el servicio.
+    """
+    def __init__(self, step_name: str, in_doubt: bool = False):
+        super().__init__(f"Deadline exceeded at step '{step_name}'")
+        self.step_name = step_name
+        self.in_doubt = in_doubt
+
+def request_may_have_run(exc: Exception) -> bool:
+    """
+    Indica si una llamada fallida pudo ejecutarse en el servicio. Solo se descarta cuando
+    la petición nunca salió: sin turno en el limitador o sin conexión establecida.
+    """
+    return not isinstance(exc, (QueueTimeout, httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+
+def deadline_headers(timeout: float) -> Dict[str, str]:
+    """Construye las cabeceras de presupuesto para una llamada con el timeout dado."""
+    return {
+        DEADLINE_HEADER: str(int((time.time() + timeout) * 1000)),
+        BUDGET_HEADER: str(int(timeout * 1000)),
+    }
+
+def deadline_rejected(response: httpx.Response) -> bool:
+    """El servicio descartó la petición sin ejecutarla porque su deadline ya había vencido."""
+    return response.status_code == 504 and DEADLINE_EXPIRED_HEADER in response.headers
+
+def record_budget_overrun(step_name: str):
+    budget_overruns[step_name] = budget_overruns.get(step_name, 0) + 1
+
+async def call_service(service_name: str, endpoint: str, body: Any, timeout: float) -> httpx.Response:
+    """
+    POST a un servicio respetando su limitador de concurrencia.
+    El tiempo de espera por un turno se descuenta del timeout de la llamada.
+    Lanza QueueTimeout si no hay turno a tiempo y las excepciones de httpx si la llamada falla.
+    """
+    started = time.monotonic()
+    async with limiters[service_name].slot(timeout) as slot:
+        remaining = max(timeout - (time.monotonic() - started), 0.001)
+        async with httpx.AsyncClient(timeout=remaining) as client:
+            response = await client.post(URLS[service_name] + endpoint, json=body, headers=deadline_headers(remaining))
+        if deadline_rejected(response):
+            pass  # Presupuesto agotado aguas arriba, no es una señal de sobrecarga del servicio.
+        elif response.status_code in OVERLOAD_STATUS_CODES:
+            slot.mark_overloaded()
+        elif response.status_code >= 500:
+            slot.mark_failed()
+    return response
+
+async def call_action(step: Dict[str, Any], body: Any, timeout: float) -> httpx.Response:
+    """
+    Llama a la acción de un paso. Los pasos idempotentes usan hedging si está activado;
+    el hedge solo se lanza si el limitador del servicio tiene un turno libre.
+    """
+    hedger = hedgers.get(step["name"])
+    if hedger is None:
+        return await call_service(step["name"], step["action"], body, timeout)
+    return await hedger.call(
+        lambda attempt_timeout: call_service(step["name"], step["action"], body, attempt_timeout),
+        timeout,
+        can_hedge=limiters[step["name"]].has_free_slot,
+    )
+
 # --- Lógica del Orquestador ---
 
 async def execute_saga(order_id: str):
     saga = sagas_db[order_id]
     saga.status = "PROCESSING"
+    deadline = time.monotonic() + SAGA_DEADLINE_SECONDS
+    trace = slow_sagas.start(order_id) if slow_sagas is not None else None
 
     try:
         # --- 1. Flujo Principal (Acciones) ---
-        for step in SAGA_STEPS:
+        for index, step in enumerate(SAGA_STEPS):
             step_name = step["name"]
             url = URLS[step_name] + step["action"]
+
+            # Reparte el presupuesto restante entre los pasos que faltan.
+            step_started = time.monotonic()
+            remaining = deadline - step_started
+            if remaining <= 0:
+                raise SagaDeadlineExceeded(step_name)
+            step_timeout = min(STEP_TIMEOUT_SECONDS, remaining / (len(SAGA_STEPS) - index))
             
-            print(f"[SAGA {order_id}] ==> Executing step: {step_name} at {url}")
+            print(f"[SAGA {order_id}] ==> Executing step: {step_name} at {url} (budget {step_timeout:.2f}s)")
             
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.post(url, json=saga.dict())
-                response.raise_for_status() # Lanza una excepción si el status no es 2xx
-                
-                # Actualizar el estado de la SAGA
-                result = response.json()
-                setattr(saga.generatedData, step_name, result.get(step_name))
-                saga.stepsCompleted.append(step_name)
-                sagas_db[order_id] = saga # Guardar progreso
+            try:
+                response = await call_action(step, saga.dict(), step_timeout)
+            except (httpx.TimeoutException, QueueTimeout) as exc:
+                raise SagaDeadlineExceeded(step_name, in_doubt=request_may_have_run(exc))
+            if response.status_code == 504:
+                # Si el servicio la descartó por deadline vencido, no llegó a ejecutarse; un 504
+                # de un proxy intermedio no dice si el servicio la procesó.
+                raise SagaDeadlineExceeded(step_name, in_doubt=not deadline_rejected(response))
+            response.raise_for_status() # Lanza una excepción si el status no es 2xx
+
+            # Actualizar el estado de la SAGA
+            result = response.json()
+            setattr(saga.generatedData, step_name, result.get(step_name))
+            saga.stepsCompleted.append(step_name)
+            sagas_db[order_id] = saga # Guardar progreso
+            if trace is not None:
+                trace.record(step_name, step_started)
 
         # --- 2. Si todo fue exitoso, llamar a los servicios finales ---
         saga.status = "COMPLETED"
         print(f"[SAGA {order_id}] ==> Flow completed successfully. Executing final steps.")
-        await execute_final_steps(saga, success=True)
+        await execute_final_steps(saga, success=True, trace=trace)
 
     except httpx.HTTPStatusError as e:
         # --- 3. Si algo falla, iniciar compensación ---
@@ -121,51 +330,242 @@ async def execute_saga(order_id: str):
         # Guardar el error en el estado
         error_info = {"status": "FAILED", "error": e.response.text, "statusCode": e.response.status_code}
         setattr(saga.generatedData, failed_step, error_info)
+        if trace is not None:
+            trace.record(failed_step, step_started, "FAILED")
 
-        await execute_compensations(saga)
-        await execute_final_steps(saga, success=False)
+        await execute_compensations(saga, trace=trace)
+        await execute_final_steps(saga, success=False, trace=trace)
+
+    except httpx.RequestError as e:
+        # --- Servicio inalcanzable (conexión rechazada, DNS...): también se compensa ---
+        failed_step = step["name"]
+        print(f"[SAGA {order_id}] ==> ❌ FAILED at step: {failed_step}. Reason: {type(e).__name__}: {e}")
+        saga.status = "CANCELLING"
+
+        error_info = {"status": "FAILED", "error": f"{type(e).__name__}: {e}", "statusCode": 503}
+        setattr(saga.generatedData, failed_step, error_info)
+        if request_may_have_run(e):
+            saga.stepsInDoubt.append(failed_step)
+        if trace is not None:
+            trace.record(failed_step, step_started, "UNREACHABLE")
+
+        await execute_compensations(saga, trace=trace)
+        await execute_final_steps(saga, success=False, trace=trace)
+
+    except SagaDeadlineExceeded as e:
+        # --- 4. Presupuesto agotado: compensar directamente sin esperar más ---
+        record_budget_overrun(e.step_name)
+        print(f"[SAGA {order_id}] ==> ⏱️ DEADLINE EXCEEDED at step: {e.step_name}")
+        saga.status = "CANCELLING"
+
+        error_info = {"status": "FAILED", "error": "DEADLINE_EXCEEDED", "statusCode": 504}
+        setattr(saga.generatedData, e.step_name, error_info)
+        if e.in_doubt:
+            saga.stepsInDoubt.append(e.step_name)
+        if trace is not None:
+            trace.record(e.step_name, step_started, "DEADLINE_EXCEEDED")
+
+        await execute_compensations(saga, trace=trace)
+        await execute_final_steps(saga, success=False, trace=trace)
 
     finally:
         print(f"[SAGA {order_id}] ==> Final state: {saga.status}")
         sagas_db[order_id] = saga
+        if trace is not None:
+            slow_sagas.finish(trace, saga.status)
+
+# Resultados posibles de una compensación
+COMPENSATION_DONE = "DONE"
+COMPENSATION_RETRY = "RETRY"
+COMPENSATION_FAILED = "FAILED"
+
+def classify_compensation_response(response: httpx.Response) -> str:
+    """
+    2xx y 404 (no hay nada que compensar) cuentan como éxito; 408, 429 y 5xx se reintentan.
+    Cualquier otro 4xx es un error permanente que requiere intervención manual.
+    """
+    if response.is_success or response.status_code == 404:
+        return COMPENSATION_DONE
+    if response.status_code in (408, 429) or response.status_code >= 500:
+        return COMPENSATION_RETRY
+    return COMPENSATION_FAILED
 
-async def execute_compensations(saga: SagaState):
+async def call_compensation(saga: SagaState, step_name: str) -> str:
+    step_info = SAGA_STEPS_BY_NAME[step_name]
+    url = URLS[step_name] + step_info["compensation"]
+    print(f"[SAGA {saga.orderId}] ==> Compensating step: {step_name} at {url}")
+    try:
+        response = await call_service(step_name, step_info["compensation"], saga.dict(), COMPENSATION_TIMEOUT_SECONDS)
+        outcome = classify_compensation_response(response)
+        error = f"HTTP {response.status_code}: {response.text}"
+    except (httpx.RequestError, QueueTimeout) as comp_exc:
+        outcome = COMPENSATION_RETRY
+        error = f"{type(comp_exc).__name__}: {comp_exc}"
+
+    if outcome == COMPENSATION_DONE:
+        saga.compensationsExecuted.append(step_name)
+    elif outcome == COMPENSATION_RETRY:
+        print(f"[SAGA {saga.orderId}] ==> ⚠️ Compensation for {step_name} failed, queued for retry: {error}")
+        compensation_queue.enqueue(saga.orderId, step_name, saga.dict(), step_info.get("compensateAfter", []), error)
+    else:
+        print(f"[SAGA {saga.orderId}] ==> 🚨 CRITICAL: Compensation for {step_name} failed permanently: {error}")
+    return outcome
+
+async def execute_compensations(saga: SagaState, trace: Optional[SagaTrace] = None):
+    """
+    Compensa los pasos completados y los que quedaron en duda. Las compensaciones sin restricción de orden
+    (compensateAfter) se lanzan en paralelo; las fallidas quedan en la cola de reintentos.
+    """
     print(f"[SAGA {saga.orderId}] ==> Starting compensation flow...")
-    steps_to_compensate = reversed(saga.stepsCompleted)
-    
-    for step_name in steps_to_compensate:
-        step_info = next((s for s in SAGA_STEPS if s["name"] == step_name), None)
-        if step_info:
-            url = URLS[step_name] + step_info["compensation"]
-            print(f"[SAGA {saga.orderId}] ==> Compensating step: {step_name} at {url}")
-            try:
-                async with httpx.AsyncClient(timeout=10.0) as client:
-                    await client.post(url, json=saga.dict())
-                saga.compensationsExecuted.append(step_name)
-            except Exception as comp_exc:
-                print(f"[SAGA {saga.orderId}] ==> 🚨 CRITICAL: Compensation for {step_name} failed: {comp_exc}")
-    
-    saga.status = "FAILED_AND_COMPENSATED"
+    compensation_started = time.monotonic()
+    tasks: Dict[str, asyncio.Task] = {}
+
+    async def compensate(step_name: str) -> str:
+        after = [tasks[dep] for dep in SAGA_STEPS_BY_NAME[step_name].get("compensateAfter", []) if dep in tasks]
+        if after:
+            dep_outcomes = await asyncio.gather(*after)
+            if COMPENSATION_FAILED in dep_outcomes:
+                # Una dependencia falló de forma permanente: compensar este paso rompería el orden.
+                print(f"[SAGA {saga.orderId}] ==> 🚨 CRITICAL: Compensation for {step_name} blocked by a failed dependency")
+                return COMPENSATION_FAILED
+            if any(outcome != COMPENSATION_DONE for outcome in dep_outcomes):
+                # Una dependencia no terminó: este paso espera en la cola detrás de ella.
+                compensation_queue.enqueue(saga.orderId, step_name, saga.dict(),
+                                           SAGA_STEPS_BY_NAME[step_name].get("compensateAfter", []),
+                                           "Waiting for dependent compensations")
+                return COMPENSATION_RETRY
+        return await call_compensation(saga, step_name)
+
+    # Los pasos en duda se compensan igual: si no llegaron a ejecutarse, la compensación
+    # responde NOT_FOUND y cuenta como hecha.
+    for step_name in reversed(saga.stepsCompleted + saga.stepsInDoubt):
+        if step_name in SAGA_STEPS_BY_NAME:
+            tasks[step_name] = asyncio.create_task(compensate(step_name))
+    outcomes = await asyncio.gather(*tasks.values())
 
-async def execute_final_steps(saga: SagaState, success: bool):
+    # Mientras se esperaba al resto, el worker de reintentos pudo completar (o dar por fallidas)
+    # compensaciones encoladas: el estado final se decide por lo que sigue en la cola.
+    if COMPENSATION_FAILED in outcomes or saga.status == "COMPENSATION_FAILED":
+        saga.status = "COMPENSATION_FAILED"
+    elif compensation_queue.pending_for(saga.orderId):
+        saga.status = "COMPENSATION_PENDING"
+    else:
+        saga.status = "FAILED_AND_COMPENSATED"
+    if trace is not None:
+        trace.record("compensations", compensation_started, saga.status)
+
+def mark_compensated(order_id: str, step_name: str):
+    """Registra una compensación completada por el worker y cierra la SAGA si no queda nada pendiente."""
+    saga = sagas_db.get(order_id)
+    if saga is None:
+        return  # La SAGA no está en memoria (p. ej. tras un reinicio); la compensación igual se ejecutó.
+    saga.compensationsExecuted.append(step_name)
+    if saga.status == "COMPENSATION_PENDING" and not compensation_queue.pending_for(order_id):
+        saga.status = "FAILED_AND_COMPENSATED"
+        print(f"[SAGA {order_id}] ==> All pending compensations completed. Final state: {saga.status}")
+
+async def retry_compensation_batch(step_name: str, keys: List[str]):
+    """
+    Reintenta un grupo de compensaciones del mismo servicio. Un grupo de varias
+    entradas se envía en una sola llamada al endpoint por lotes del servicio.
+    """
+    step_info = SAGA_STEPS_BY_NAME[step_name]
+    payloads = [compensation_queue.entries[key]["payload"] for key in keys]
+    if len(keys) > 1:
+        endpoint = step_info["batchCompensation"]
+        body = {"sagas": payloads}
+    else:
+        endpoint = step_info["compensation"]
+        body = payloads[0]
+
+    try:
+        response = await call_service(step_name, endpoint, body, COMPENSATION_TIMEOUT_SECONDS)
+        outcome = classify_compensation_response(response)
+        error = f"HTTP {response.status_code}: {response.text}"
+    except (httpx.RequestError, QueueTimeout) as comp_exc:
+        outcome = COMPENSATION_RETRY
+        error = f"{type(comp_exc).__name__}: {comp_exc}"
+
+    if outcome == COMPENSATION_RETRY:
+        compensation_queue.reschedule(keys, error)
+        return
+
+    order_ids = [compensation_queue.entries[key]["orderId"] for key in keys]
+    compensation_queue.remove(keys)
+    for order_id in order_ids:
+        if outcome == COMPENSATION_DONE:
+            print(f"[SAGA {order_id}] ==> Compensation for {step_name} completed on retry")
+            mark_compensated(order_id, step_name)
+        else:
+            print(f"[SAGA {order_id}] ==> 🚨 CRITICAL: Compensation for {step_name} failed permanently: {error}")
+            # Las compensaciones que esperaban a esta ya no pueden ejecutarse en orden.
+            for blocked in compensation_queue.remove_dependents(order_id, step_name):
+                print(f"[SAGA {order_id}] ==> 🚨 CRITICAL: Compensation for {blocked} blocked by the failed {step_name} compensation")
+            saga = sagas_db.get(order_id)
+            if saga is not None:
+                saga.status = "COMPENSATION_FAILED"
+
+def compensation_retry_groups(due: Dict[str, List[str]]):
+    """Agrupa las entradas vencidas en lotes por servicio (o de una en una si no hay endpoint por lotes)."""
+    for step_name, keys in due.items():
+        if "batchCompensation" in SAGA_STEPS_BY_NAME[step_name]:
+            for i in range(0, len(keys), COMPENSATION_BATCH_SIZE):
+                yield step_name, keys[i:i + COMPENSATION_BATCH_SIZE]
+        else:
+            for key in keys:
+                yield step_name, [key]
+
+async def compensation_retry_worker():
+    """Procesa periódicamente la cola de compensaciones, agrupando por servicio."""
+    while True:
+        await asyncio.sleep(COMPENSATION_RETRY_INTERVAL_SECONDS)
+        due = compensation_queue.due()
+        if not due:
+            continue
+        try:
+            await asyncio.gather(*(
+                retry_compensation_batch(step_name, keys)
+                for step_name, keys in compensation_retry_groups(due)
+            ))
+        except Exception as e:
+            print(f"==> Warning: compensation retry round failed: {e}")
+
+async def execute_final_steps(saga: SagaState, success: bool, trace: Optional[SagaTrace] = None):
     """Llama a los servicios de notificación, seguimiento y cliente."""
     context = "confirmation" if success else "cancellation"
     
     # Lógica simplificada, en un caso real los endpoints podrían variar
-    await call_final_service("notification", f"/send_confirmation", saga)
-    await call_final_service("tracking", f"/update_status", saga) # Este servicio leería el estado de la saga
-    await call_final_service("customer", f"/update_history", saga)
+    # (tracking leería el estado de la saga)
+    for step in FINAL_STEPS:
+        step_started = time.monotonic()
+        outcome = await call_final_service(step, saga)
+        if trace is not None:
+            trace.record(step["name"], step_started, outcome)
 
-async def call_final_service(service_name: str, endpoint: str, saga: SagaState):
+async def call_final_service(step: Dict[str, Any], saga: SagaState) -> str:
+    """
+    Llama a un servicio final. Un fallo no detiene la SAGA, pero se devuelve el resultado
+    ("OK", "FAILED", "TIMEOUT" o "UNREACHABLE") para que quede en la traza.
+    """
+    service_name = step["name"]
     try:
-        url = URLS[service_name] + endpoint
         print(f"[SAGA {saga.orderId}] ==> Calling final service: {service_name}")
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.post(url, json=saga.dict())
-            result = response.json()
-            setattr(saga.generatedData, service_name, result.get(service_name))
+        response = await call_action(step, saga.dict(), FINAL_STEP_TIMEOUT_SECONDS)
+        result = response.json()
+        setattr(saga.generatedData, service_name, result.get(service_name))
+        if not response.is_success:
+            print(f"[SAGA {saga.orderId}] ==> Warning: Final service {service_name} failed: HTTP {response.status_code}")
+            return "FAILED"
+        return "OK"
+    except (httpx.TimeoutException, QueueTimeout) as e:
+        print(f"[SAGA {saga.orderId}] ==> Warning: Final service {service_name} timed out: {type(e).__name__}")
+        return "TIMEOUT"
+    except httpx.RequestError as e:
+        print(f"[SAGA {saga.orderId}] ==> Warning: Final service {service_name} failed: {type(e).__name__}: {e}")
+        return "UNREACHABLE"
     except Exception as e:
         print(f"[SAGA {saga.orderId}] ==> Warning: Final service {service_name} failed: {e}")
+        return "FAILED"
 
 # --- Endpoints de la API ---
 
@@ -191,6 +591,34 @@ async def get_saga_status(order_id: str):
         raise HTTPException(status_code=404, detail="SAGA with that Order ID not found.")
     return sagas_db[order_id]
 
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Devuelve las métricas del orquestador: presupuestos agotados por paso, compensaciones
+    pendientes, límites de concurrencia por servicio y hedging de los pasos idempotentes.
+    """
+    return {
+        "budgetOverruns": budget_overruns,
+        "compensationQueue": compensation_queue.stats(),
+        "concurrencyLimits": {name: limiter.stats() for name, limiter in limiters.items()},
+        "hedging": {
+            "enabled": HEDGING_ENABLED,
+            "budget": hedge_budget.stats(),
+            "steps": {name: hedger.stats() for name, hedger in hedgers.items()},
+        },
+    }
+
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
+    return {"status": "healthy"}
+
+# --- Endpoints de Diagnóstico ---
+if DIAGNOSTICS_ENABLED:
+    admin = admin_router()
+
+    @admin.get("/slow_sagas")
+    async def get_slow_sagas():
+        """Las SAGAs más lentas desde el arranque, con el tiempo de cada paso."""
+        return slow_sagas.snapshot()
+
+    app.include_router(admin)
@@ -0,0 +1,63 @@
+import heapq
+import itertools
+import time
+from typing import Any, Dict, List, Tuple
+
+
+class SagaTrace:
+    """Tiempos de una SAGA en curso: duración de cada paso y de cada fase."""
+
+    def __init__(self, order_id: str):
+        self.order_id = order_id
+        self.started = time.monotonic()
+        self.steps: List[Dict[str, Any]] = []
+
+    def record(self, name: str, started: float, outcome: str = "OK") -> None:
+        """Registra un paso o fase que empezó en `started` (time.monotonic) y acaba de terminar."""
+        self.steps.append({"step": name, "ms": round((time.monotonic() - started) * 1000, 2), "outcome": outcome})
+
+
+class SlowSagaLog:
+    """
+    Buffer acotado con las `capacity` SAGAs más lentas vistas desde el arranque.
+
+    Es un min-heap por duración: una SAGA nueva solo entra si es más lenta que la más
+    rápida del buffer, y la reemplaza. Registrar cuesta O(log capacity).
+    """
+
+    def __init__(self, capacity: int = 50):
+        self.capacity = capacity
+        self.recorded = 0
+        self._heap: List[Tuple[float, int, Dict[str, Any]]] = []
+        self._sequence = itertools.count()  # Desempate estable para duraciones iguales
+
+    def start(self, order_id: str) -> SagaTrace:
+        return SagaTrace(order_id)
+
+    def finish(self, trace: SagaTrace, status: str) -> None:
+        self.recorded += 1
+        if self.capacity <= 0:
+            return  # Capacidad 0: no se guarda ninguna SAGA.
+        total = time.monotonic() - trace.started
+        if len(self._heap) >= self.capacity and total <= self._heap[0][0]:
+            return
+        entry = {
+            "orderId": trace.order_id,
+            "status": status,
+            "totalMs": round(total * 1000, 2),
+            "finishedAt": time.time(),
+            "steps": trace.steps,
+        }
+        item = (total, next(self._sequence), entry)
+        if len(self._heap) < self.capacity:
+            heapq.heappush(self._heap, item)
+        else:
+            heapq.heapreplace(self._heap, item)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """SAGAs registradas, de la más lenta a la más rápida."""
+        return {
+            "capacity": self.capacity,
+            "recorded": self.recorded,
+            "sagas": [entry for _, _, entry in sorted(self._heap, reverse=True)],
+        }
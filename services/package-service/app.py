@@ -1,36 +1,63 @@
-from flask import Flask, request, jsonify
+from fastapi import Depends
 import uuid
 import os
 
-app = Flask(__name__)
+from saga_kit import FastJSONResponse, IdempotencyStore, SagaBatch, SagaPayload, create_app, open_journal, saga_batch, saga_payload
 
-packages = []
+SERVICE_NAME = os.getenv("SERVICE_NAME", "package-service")
+
+# { "orderId-123": {"packageId": "PKG-...", "status": "PACKAGED"} }
+packages = IdempotencyStore(journal=open_journal("packages"))
+
+app = create_app(SERVICE_NAME, title="Package Service", stores={"packages": packages})
+
+@app.post('/create_package')
+async def create_package(saga: SagaPayload = Depends(saga_payload)):
+    # Idempotente por orderId: un reintento devuelve el mismo paquete
+    if saga.orderId and saga.orderId in packages:
+        return FastJSONResponse({"package": packages[saga.orderId]}, status_code=200)
 
-@app.route('/create_package', methods=['POST'])
-def create_package():
     package_id = f"PKG-{uuid.uuid4().hex[:6].upper()}"
     package = {"packageId": package_id, "status": "PACKAGED"}
-    packages.append(package)
-    return jsonify({"package": package}), 201
-
-@app.route('/cancel_package', methods=['POST'])
-def cancel_package():
-    data = request.get_json()
-    package_id = data.get("packageId")
-    for p in packages:
-        if p["packageId"] == package_id:
-            p["status"] = "CANCELLED"
-            return jsonify({"package": p}), 200
-    return jsonify({"error": "Package not found"}), 404
-
-@app.route('/packages', methods=['GET'])
-def get_packages():
-    return jsonify({"packages": packages}), 200
-
-@app.route('/health', methods=['GET'])
-def health():
-    return "OK", 200
+    packages[saga.orderId or package_id] = package
+    return FastJSONResponse({"package": package}, status_code=201)
+
+def cancel(saga: SagaPayload):
+    """Marca como anulado el paquete de la orden. Devuelve None si no existe."""
+    key = saga.orderId if saga.orderId in packages else None
+    if key is None:
+        # Compatibilidad: buscar por el packageId generado en el paso anterior
+        package_id = (saga.generatedData.get("package") or {}).get("packageId")
+        key = next((k for k, p in packages.items() if p["packageId"] == package_id), None)
+    if key is None:
+        return None
+    package = packages[key]
+    package["status"] = "CANCELLED"
+    packages[key] = package
+    return package
+
+@app.post('/cancel_package')
+async def cancel_package(saga: SagaPayload = Depends(saga_payload)):
+    package = cancel(saga)
+    if package is not None:
+        return {"package": package}
+    return FastJSONResponse({"error": "Package not found"}, status_code=404)
+
+@app.post('/cancel_package/batch')
+async def cancel_package_batch(batch: SagaBatch = Depends(saga_batch)):
+    # Los paquetes que no existen se ignoran: no hay nada que anular
+    cancelled = []
+    for saga in batch.sagas:
+        package = cancel(saga)
+        if package is not None:
+            cancelled.append(package)
+    return {"package": cancelled}
+
+@app.get('/packages')
+async def get_packages():
+    return {"packages": list(packages.values())}
 
 if __name__ == '__main__':
+    import uvicorn
     port = int(os.getenv("SERVICE_PORT", 5003))
-    app.run(host='0.0.0.0', port=port)
\ No newline at end of file
+    uvicorn.run(app, host='0.0.0.0', port=port)
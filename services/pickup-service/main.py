@@ -1,49 +1,45 @@
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import Depends
 import os
 import random
-from datetime import datetime
 
-app = FastAPI(
-    title="Pickup Service",
-    description="Servicio para gestionar fecha y hora de entrega como parte de la SAGA."
-)
+from saga_kit import FastJSONResponse, IdempotencyStore, SagaPayload, create_app, open_journal, saga_payload
 
 
 SERVICE_NAME = os.getenv("SERVICE_NAME", "pickup-service")
 SERVICE_PORT = int(os.getenv("SERVICE_PORT", "5006"))
 
 
-pickups_db  = {}
-
+pickups_db = IdempotencyStore(journal=open_journal("pickups"))
 
-@app.post("/schedule_pickup")
-async def reserve_space(request: Request):
-
-    saga_data = await request.json()
-    
-    order_id = saga_data.get("orderId")
-    request_data = saga_data.get("request_data", {})
+app = create_app(
+    SERVICE_NAME,
+    title="Pickup Service",
+    description="Servicio para gestionar fecha y hora de entrega como parte de la SAGA.",
+    stores={"pickups": pickups_db},
+)
+logger = app.state.logger
 
-    scheduled_at = request_data.get("scheduledAt")
 
+@app.post("/schedule_pickup")
+async def schedule_pickup(saga: SagaPayload = Depends(saga_payload)):
 
-    if not all([order_id, scheduled_at]):
-        raise HTTPException(status_code=400, detail="Faltan campos requeridos: orderId o scheduledAt")
+    saga.require("orderId", "scheduledAt")
+    order_id = saga.orderId
+    scheduled_at = saga.request_data.scheduledAt
 
 
-    if order_id in pickups_db :
-        print(f"Pickup para Order ID '{order_id}' ya existe. Devolviendo éxito idempotente.")
-        existing_pickup = pickups_db[order_id]
-        return JSONResponse(content={"pickup": existing_pickup}, status_code=200)
+    existing_pickup = pickups_db.get(order_id)
+    if existing_pickup is not None:
+        logger.info("Pickup para Order ID '%s' ya existe. Devolviendo éxito idempotente.", order_id)
+        return FastJSONResponse(content={"pickup": existing_pickup}, status_code=200)
 
     pickup_id = f"PU-{random.randint(100, 999)}"
-    
+
     pickups_db[order_id] = {
         "pickupId": pickup_id,
         "scheduledAt": scheduled_at
     }
-    print(f"Pickup programado para Order ID '{order_id}' con ID '{pickup_id}' a las {scheduled_at}.")
+    logger.info("Pickup programado para Order ID '%s' con ID '%s' a las %s.", order_id, pickup_id, scheduled_at)
 
 
     response_content = {
@@ -53,50 +49,43 @@ async def reserve_space(request: Request):
             }
     }
 
-    return JSONResponse(content=response_content, status_code=201)
+    return FastJSONResponse(content=response_content, status_code=201)
 
 
 @app.post("/cancel_pickup")
-async def cancel_pickup(request: Request):
-    saga_data = await request.json()
-    order_id = saga_data.get("orderId")
+async def cancel_pickup(saga: SagaPayload = Depends(saga_payload)):
+    saga.require("orderId")
+    order_id = saga.orderId
 
-    if not order_id:
-        raise HTTPException(status_code=400, detail="Falta el campo 'orderId' en el objeto SAGA")
-
-    if order_id in pickups_db:
-        canceled_pickup = pickups_db.pop(order_id)
-        print(f"Pickup '{canceled_pickup['pickupId']}' para Order ID '{order_id}' ha sido cancelado.")
+    canceled_pickup = pickups_db.pop(order_id)
+    if canceled_pickup is not None:
+        logger.info("Pickup '%s' para Order ID '%s' ha sido cancelado.", canceled_pickup["pickupId"], order_id)
         response_content = {
             "pickup": {
                 "pickupId": canceled_pickup["pickupId"],
                 "status": "CANCELLED"
             }
         }
-        return JSONResponse(content=response_content, status_code=200)
+        return FastJSONResponse(content=response_content, status_code=200)
     else:
-        print(f"No se encontró pickup para Order ID '{order_id}'. Nada que cancelar.")
+        logger.info("No se encontró pickup para Order ID '%s'. Nada que cancelar.", order_id)
         response_content = {
             "pickup": {
                 "orderId": order_id,
                 "status": "NOT_FOUND_OR_ALREADY_CANCELLED"
             }
         }
-        return JSONResponse(content=response_content, status_code=200)
+        return FastJSONResponse(content=response_content, status_code=200)
 
 
 @app.get("/pickups")
 async def list_pickups():
-    return JSONResponse({
-        "current_pickups": pickups_db,
+    return {
+        "current_pickups": pickups_db.to_dict(),
         "count": len(pickups_db)
-    })
-
+    }
 
-@app.get("/health")
-async def health_check():
-    return JSONResponse({"service": SERVICE_NAME, "status": "healthy"})
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=SERVICE_PORT)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=SERVICE_PORT)
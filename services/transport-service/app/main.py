@@ -1,25 +1,28 @@
 # services/transport-service/app/main.py
-from flask import Flask, jsonify, request
+from fastapi import Depends
 import os, random
 
-app = Flask(__name__)
+from saga_kit import IdempotencyStore, SagaBatch, SagaPayload, create_app, open_journal, saga_batch, saga_payload
 
 # Variables de entorno
 SERVICE_NAME = os.getenv("SERVICE_NAME", "transport-service")
 SERVICE_PORT = int(os.getenv("SERVICE_PORT", 5005))
 
 # Memoria simulada
-assignments = {}
+assignments = IdempotencyStore(journal=open_journal("assignments"))
 
-@app.route("/health", methods=["GET"])
-def health():
-    return jsonify({"status": "ok", "service": SERVICE_NAME}), 200
+app = create_app(SERVICE_NAME, title="Transport Service", stores={"assignments": assignments})
 
-@app.route("/assign_carrier", methods=["POST"])
-def assign_carrier():
+@app.post("/assign_carrier")
+async def assign_carrier(saga: SagaPayload = Depends(saga_payload)):
     """Asigna un transportista a un pedido"""
-    order = request.json
-    order_id = order.get("orderId", f"ORD-{random.randint(1000,9999)}")
+    order_id = saga.orderId or f"ORD-{random.randint(1000,9999)}"
+
+    # Idempotente por orderId: un reintento devuelve la misma asignación
+    existing = assignments.get(order_id)
+    if existing is not None:
+        return existing
+
     carrier_id = f"CRR-{random.randint(10,99)}-FastShip"
 
     carrier_data = {
@@ -30,31 +33,39 @@ def assign_carrier():
     }
 
     assignments[order_id] = carrier_data
-    return jsonify(carrier_data), 200
-
-@app.route("/cancel_assignment", methods=["POST"])
-def cancel_assignment():
-    """Desasigna el transportista del pedido"""
-    order = request.json
-    order_id = order.get("orderId")
+    return carrier_data
 
-    if order_id in assignments:
-        carrier_id = assignments[order_id]["carrier"]["carrierId"]
-        assignments[order_id]["carrier"]["assigned"] = False
-        assignments[order_id]["carrier"]["status"] = "CANCELLED"
+def release_carrier(order_id):
+    assignment = assignments.get(order_id) if order_id else None
+    if assignment is not None:
+        carrier_id = assignment["carrier"]["carrierId"]
+        assignment["carrier"]["assigned"] = False
+        assignment["carrier"]["status"] = "CANCELLED"
+        assignments[order_id] = assignment
     else:
         carrier_id = "UNKNOWN"
 
-    return jsonify({
+    return {
         "status": "cancelled",
         "carrierId": carrier_id,
         "orderId": order_id
-    }), 200
+    }
+
+@app.post("/cancel_assignment")
+async def cancel_assignment(saga: SagaPayload = Depends(saga_payload)):
+    """Desasigna el transportista del pedido"""
+    return release_carrier(saga.orderId)
+
+@app.post("/cancel_assignment/batch")
+async def cancel_assignment_batch(batch: SagaBatch = Depends(saga_batch)):
+    """Desasigna los transportistas de varios pedidos en una sola llamada"""
+    return {"carrier": [release_carrier(saga.orderId) for saga in batch.sagas]}
 
-@app.route("/assignments", methods=["GET"])
-def list_assignments():
+@app.get("/assignments")
+async def list_assignments():
     """Lista todas las asignaciones almacenadas"""
-    return jsonify(assignments), 200
+    return assignments.to_dict()
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=SERVICE_PORT)
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=SERVICE_PORT)
@@ -1,12 +1,8 @@
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import Depends
 import os
 import random # Para generar un ID de ubicación de ejemplo
 
-app = FastAPI(
-    title="Warehouse Service",
-    description="Servicio para gestionar reservas de espacio en el almacén como parte de la SAGA."
-)
+from saga_kit import FastJSONResponse, IdempotencyStore, SagaBatch, SagaPayload, create_app, open_journal, saga_batch, saga_payload
 
 # --- Variables de Entorno ---
 SERVICE_NAME = os.getenv("SERVICE_NAME", "warehouse-service")
@@ -14,48 +10,48 @@ SERVICE_PORT = int(os.getenv("SERVICE_PORT", "5001"))
 
 # --- Almacenamiento en Memoria (Base de datos simulada) ---
 # { "orderId-123": {"user": "...", "product": "...", "locationId": "..."} }
-reservations_db = {}
+reservations_db = IdempotencyStore(journal=open_journal("reservations"))
+
+app = create_app(
+    SERVICE_NAME,
+    title="Warehouse Service",
+    description="Servicio para gestionar reservas de espacio en el almacén como parte de la SAGA.",
+    stores={"reservations": reservations_db},
+)
+logger = app.state.logger
 
 
 @app.post("/reserve_space")
-async def reserve_space(request: Request):
+async def reserve_space(saga: SagaPayload = Depends(saga_payload)):
     """
     Acción Principal: Reserva espacio en el almacén para una orden.
     Es idempotente: si la reserva para esta orden ya existe, devuelve el éxito.
     """
-    saga_data = await request.json()
-    
-    order_id = saga_data.get("orderId")
-    request_data = saga_data.get("request_data", {})
-    
-    user = request_data.get("user")
-    product = request_data.get("product")
-
-    if not all([order_id, user, product]):
-        raise HTTPException(status_code=400, detail="Faltan campos requeridos en el objeto SAGA: orderId, user, product")
+    saga.require("orderId", "user", "product")
+    order_id = saga.orderId
 
     # --- Lógica de Idempotencia ---
-    if order_id in reservations_db:
-        print(f"Reserva para Order ID '{order_id}' ya existe. Devolviendo éxito.")
-        location_id = reservations_db[order_id]["locationId"]
+    existing = reservations_db.get(order_id)
+    if existing is not None:
+        logger.info("Reserva para Order ID '%s' ya existe. Devolviendo éxito.", order_id)
         response_content = {
             "warehouse": {
-                "locationId": location_id,
+                "locationId": existing["locationId"],
                 "spaceReserved": True
             }
         }
-        return JSONResponse(content=response_content, status_code=200)
+        return FastJSONResponse(content=response_content, status_code=200)
 
     # --- Lógica de Negocio ---
     # Simula la asignación de un espacio físico en el almacén
     location_id = f"BAY-{random.randint(10, 99)}"
-    
+
     reservations_db[order_id] = {
-        "user": user,
-        "product": product,
+        "user": saga.request_data.user,
+        "product": saga.request_data.product,
         "locationId": location_id
     }
-    print(f"Espacio reservado para Order ID '{order_id}' en la ubicación '{location_id}'.")
+    logger.info("Espacio reservado para Order ID '%s' en la ubicación '%s'.", order_id, location_id)
 
     # --- Construcción de la Respuesta según el Contrato SAGA ---
     response_content = {
@@ -64,64 +60,49 @@ async def reserve_space(request: Request):
             "spaceReserved": True
         }
     }
-    return JSONResponse(content=response_content, status_code=201) # 201 Created es más apropiado aquí
+    return FastJSONResponse(content=response_content, status_code=201) # 201 Created es más apropiado aquí
+
+
+def release_reservation(order_id: str) -> dict:
+    """Libera la reserva de la orden y devuelve el resultado de la compensación."""
+    removed_reservation = reservations_db.pop(order_id)
+    if removed_reservation is not None:
+        logger.info("Reserva para Order ID '%s' en '%s' ha sido cancelada.", order_id, removed_reservation["locationId"])
+        return {"orderId": order_id, "status": "COMPENSATED"}
+    # Si la reserva no existe, la compensación se considera exitosa (ya no está).
+    logger.info("No se encontró reserva para Order ID '%s'. La compensación no es necesaria.", order_id)
+    return {"orderId": order_id, "status": "NOT_FOUND_OR_ALREADY_COMPENSATED"}
 
 
 @app.post("/cancel_reservation")
-async def cancel_reservation(request: Request):
+async def cancel_reservation(saga: SagaPayload = Depends(saga_payload)):
     """
     Acción de Compensación: Libera un espacio previamente reservado.
     """
-    saga_data = await request.json()
-    
-    order_id = saga_data.get("orderId")
-    request_data = saga_data.get("request_data", {})
-    
-    user = request_data.get("user")
-    product = request_data.get("product")
-
-    if not order_id:
-        raise HTTPException(status_code=400, detail="Falta el campo 'orderId' en el objeto SAGA")
-
-    if order_id in reservations_db:
-        removed_reservation = reservations_db.pop(order_id)
-        print(f"Reserva para Order ID '{order_id}' en '{removed_reservation['locationId']}' ha sido cancelada.")
-        
-        # Respuesta de compensación exitosa
-        response_content = {
-            "warehouse": {
-                "orderId": order_id,
-                "status": "COMPENSATED"
-            }
-        }
-        return JSONResponse(content=response_content, status_code=200)
-    else:
-        # Si la reserva no existe, la compensación se considera exitosa (ya no está).
-        print(f"No se encontró reserva para Order ID '{order_id}'. La compensación no es necesaria.")
-        response_content = {
-            "warehouse": {
-                "orderId": order_id,
-                "status": "NOT_FOUND_OR_ALREADY_COMPENSATED"
-            }
-        }
-        return JSONResponse(content=response_content, status_code=200)
+    saga.require("orderId")
+    return FastJSONResponse(content={"warehouse": release_reservation(saga.orderId)}, status_code=200)
+
+
+@app.post("/cancel_reservation/batch")
+async def cancel_reservation_batch(batch: SagaBatch = Depends(saga_batch)):
+    """
+    Compensación por lotes: libera las reservas de varias órdenes en una sola llamada.
+    """
+    for saga in batch.sagas:
+        saga.require("orderId")
+    results = [release_reservation(saga.orderId) for saga in batch.sagas]
+    return FastJSONResponse(content={"warehouse": results}, status_code=200)
 
 
 @app.get("/reservations")
 async def list_reservations():
     """Endpoint de utilidad para ver el estado actual de las reservas."""
-    return JSONResponse({
-        "current_reservations": reservations_db,
+    return {
+        "current_reservations": reservations_db.to_dict(),
         "count": len(reservations_db)
-    })
-
-
-@app.get("/health")
-async def health_check():
-    """Verifica el estado del servicio para Kubernetes."""
-    return JSONResponse({"service": SERVICE_NAME, "status": "healthy"})
+    }
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=SERVICE_PORT)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=SERVICE_PORT)